@@ -18,7 +18,8 @@ if config.config_file_name is not None:
 # for 'autogenerate' support
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
-target_metadata = None
+from src.database import metadata_obj
+target_metadata = metadata_obj
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
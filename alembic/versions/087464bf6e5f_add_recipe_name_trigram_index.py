@@ -0,0 +1,32 @@
+"""add recipe name trigram index
+
+Revision ID: 087464bf6e5f
+Revises: 0e3b56ef9022
+Create Date: 2026-10-18 10:03:51.402917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '087464bf6e5f'
+down_revision = '0e3b56ef9022'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # serves both the `search` similarity mode and the `recipe` ILIKE '%x%' filter
+    op.create_index(
+        'ix_recipes_recipe_name_trgm',
+        'recipes',
+        ['recipe_name'],
+        postgresql_using='gin',
+        postgresql_ops={'recipe_name': 'gin_trgm_ops'},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recipes_recipe_name_trgm', table_name='recipes')
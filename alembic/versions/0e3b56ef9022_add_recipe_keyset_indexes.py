@@ -0,0 +1,37 @@
+"""add recipe keyset pagination indexes
+
+Revision ID: 0e3b56ef9022
+Revises: 1740b8fd4eb5
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0e3b56ef9022'
+down_revision = '1740b8fd4eb5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # one index per sort option of GET /recipes/, each ending in recipe_id so
+    # the (sort key, recipe_id) cursor can seek straight to the next page
+    op.create_index('ix_recipes_recipe_name_recipe_id', 'recipes', ['recipe_name', 'recipe_id'])
+    op.create_index('ix_recipes_prep_time_mins_recipe_id', 'recipes', ['prep_time_mins', 'recipe_id'])
+    op.create_index(
+        'ix_recipes_number_of_favorites_recipe_id',
+        'recipes',
+        [sa.text('number_of_favorites DESC NULLS LAST'), 'recipe_id'],
+    )
+    # GET /favorited_recipes/ looks up a single user's favorites
+    op.create_index('ix_favorited_recipes_user_id_recipe_id', 'favorited_recipes', ['user_id', 'recipe_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_favorited_recipes_user_id_recipe_id', table_name='favorited_recipes')
+    op.drop_index('ix_recipes_number_of_favorites_recipe_id', table_name='recipes')
+    op.drop_index('ix_recipes_prep_time_mins_recipe_id', table_name='recipes')
+    op.drop_index('ix_recipes_recipe_name_recipe_id', table_name='recipes')
@@ -0,0 +1,32 @@
+"""create recipe_documents table
+
+Revision ID: 142a934b174b
+Revises: 087464bf6e5f
+Create Date: 2026-10-18 11:20:07.684533
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '142a934b174b'
+down_revision = '087464bf6e5f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # read model for GET /recipes/{recipe_id}, backfilled with
+    # `python -m src.recipe_documents`
+    op.create_table(
+        'recipe_documents',
+        sa.Column('recipe_id', sa.Integer, primary_key=True),
+        sa.Column('document', postgresql.JSONB, nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('recipe_documents')
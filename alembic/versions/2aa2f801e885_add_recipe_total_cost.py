@@ -0,0 +1,44 @@
+"""add recipe total cost
+
+Revision ID: 2aa2f801e885
+Revises: 793a27c24ade
+Create Date: 2026-10-18 19:02:17.503861
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2aa2f801e885'
+down_revision = '793a27c24ade'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # the sum of the recipe's ingredient prices, kept up to date by the
+    # endpoints that write ingredient_quantities so GET /recipes/ can filter
+    # and sort on it without aggregating
+    op.add_column('recipes', sa.Column('total_cost_usd', sa.Float(), nullable=True))
+    op.execute(
+        """
+        UPDATE recipes SET total_cost_usd = costs.total
+        FROM (
+            SELECT recipe_id, SUM(ingredient_price_usd) AS total
+            FROM ingredient_quantities
+            GROUP BY recipe_id
+        ) AS costs
+        WHERE costs.recipe_id = recipes.recipe_id
+        """
+    )
+    # cost and calorie range filters and sorts, ending in recipe_id for the
+    # keyset cursor like the other sort indexes
+    op.create_index('ix_recipes_total_cost_usd_recipe_id', 'recipes', ['total_cost_usd', 'recipe_id'])
+    op.create_index('ix_recipes_calories_recipe_id', 'recipes', ['calories', 'recipe_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recipes_calories_recipe_id', table_name='recipes')
+    op.drop_index('ix_recipes_total_cost_usd_recipe_id', table_name='recipes')
+    op.drop_column('recipes', 'total_cost_usd')
@@ -0,0 +1,26 @@
+"""add ingredient_quantities ingredient index
+
+Revision ID: 793a27c24ade
+Revises: 8b895450c63b
+Create Date: 2026-10-18 16:03:44.215873
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '793a27c24ade'
+down_revision = '8b895450c63b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # the primary key leads with recipe_id; GET /ingredients/{ingr_id} pages
+    # through one ingredient's recipes in recipe_id order
+    op.create_index('ix_ingredient_quantities_ingredient_id_recipe_id', 'ingredient_quantities', ['ingredient_id', 'recipe_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_ingredient_quantities_ingredient_id_recipe_id', table_name='ingredient_quantities')
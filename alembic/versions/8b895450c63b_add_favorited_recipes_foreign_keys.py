@@ -0,0 +1,32 @@
+"""add favorited_recipes foreign keys
+
+Revision ID: 8b895450c63b
+Revises: c266759f3c5a
+Create Date: 2026-10-18 15:22:51.470236
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b895450c63b'
+down_revision = 'c266759f3c5a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # favorite_recipe relies on these to reject unknown users and recipes in
+    # the same statement that inserts the favorite; drop rows that would
+    # violate them first. The names match the ones Postgres generates, as in
+    # src/post_fake_data.py.
+    op.execute("DELETE FROM favorited_recipes WHERE user_id NOT IN (SELECT user_id FROM users)")
+    op.execute("DELETE FROM favorited_recipes WHERE recipe_id NOT IN (SELECT recipe_id FROM recipes)")
+    op.create_foreign_key('favorited_recipes_user_id_fkey', 'favorited_recipes', 'users', ['user_id'], ['user_id'])
+    op.create_foreign_key('favorited_recipes_recipe_id_fkey', 'favorited_recipes', 'recipes', ['recipe_id'], ['recipe_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('favorited_recipes_recipe_id_fkey', 'favorited_recipes', type_='foreignkey')
+    op.drop_constraint('favorited_recipes_user_id_fkey', 'favorited_recipes', type_='foreignkey')
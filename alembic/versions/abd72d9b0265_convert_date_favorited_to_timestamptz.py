@@ -0,0 +1,47 @@
+"""convert date_favorited to timestamptz
+
+Revision ID: abd72d9b0265
+Revises: 2aa2f801e885
+Create Date: 2026-10-18 19:48:06.310942
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'abd72d9b0265'
+down_revision = '2aa2f801e885'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # date_favorited held str(datetime.now()) (or a bare date in seeded
+    # rows), read in the session time zone; anything else can't be trusted
+    # as a time and becomes NULL. As timestamptz it can be indexed for the
+    # time window of GET /recipes/trending.
+    op.alter_column(
+        'favorited_recipes',
+        'date_favorited',
+        type_=sa.DateTime(timezone=True),
+        postgresql_using=(
+            "CASE WHEN date_favorited ~ '^\\d{4}-\\d{2}-\\d{2}' THEN date_favorited::timestamptz END"
+        ),
+        server_default=sa.text('now()'),
+    )
+    # recipe_id is included so the trending query reads only the index
+    op.create_index(
+        'ix_favorited_recipes_date_favorited_recipe_id', 'favorited_recipes', ['date_favorited', 'recipe_id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_favorited_recipes_date_favorited_recipe_id', table_name='favorited_recipes')
+    op.alter_column(
+        'favorited_recipes',
+        'date_favorited',
+        type_=sa.String(50),
+        postgresql_using='date_favorited::text',
+        server_default=None,
+    )
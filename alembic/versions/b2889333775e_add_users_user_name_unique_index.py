@@ -0,0 +1,32 @@
+"""add users user_name unique index
+
+Revision ID: b2889333775e
+Revises: ef98ea65f15a
+Create Date: 2026-10-18 14:05:12.318409
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2889333775e'
+down_revision = 'ef98ea65f15a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # registration used to check-then-insert, so racing signups could create
+    # the same name twice; the oldest account keeps the name and later ones
+    # get their user_id appended (trimmed to fit varchar(50))
+    op.execute("""
+        UPDATE users
+        SET user_name = left(user_name, 49 - length(user_id::text)) || '_' || user_id
+        WHERE user_id NOT IN (SELECT MIN(user_id) FROM users GROUP BY user_name)
+    """)
+    op.create_index('ix_users_user_name', 'users', ['user_name'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_user_name', table_name='users')
@@ -0,0 +1,32 @@
+"""create recipe_favorite_deltas table
+
+Revision ID: c266759f3c5a
+Revises: b2889333775e
+Create Date: 2026-10-18 14:48:37.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c266759f3c5a'
+down_revision = 'b2889333775e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # append only log of favorite count changes, folded into
+    # recipes.number_of_favorites by `python -m src.favorite_counts`
+    op.create_table(
+        'recipe_favorite_deltas',
+        sa.Column('delta_id', sa.BigInteger, sa.Identity(), primary_key=True),
+        sa.Column('recipe_id', sa.Integer, nullable=False),
+        sa.Column('delta', sa.SmallInteger, nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('recipe_favorite_deltas')
@@ -0,0 +1,28 @@
+"""add bridge table reverse indexes
+
+Revision ID: ef98ea65f15a
+Revises: 142a934b174b
+Create Date: 2026-10-18 12:41:29.935170
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ef98ea65f15a'
+down_revision = '142a934b174b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # the primary keys lead with recipe_id; the cuisine / meal type filters of
+    # GET /recipes/ probe the bridge tables by type id
+    op.create_index('ix_recipe_cuisine_types_cuisine_type_id_recipe_id', 'recipe_cuisine_types', ['cuisine_type_id', 'recipe_id'])
+    op.create_index('ix_recipe_meal_types_meal_type_id_recipe_id', 'recipe_meal_types', ['meal_type_id', 'recipe_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recipe_meal_types_meal_type_id_recipe_id', table_name='recipe_meal_types')
+    op.drop_index('ix_recipe_cuisine_types_cuisine_type_id_recipe_id', table_name='recipe_cuisine_types')
@@ -0,0 +1,91 @@
+"""
+Requests/sec of one uvicorn worker under many concurrent clients, with the
+sync (psycopg2 in the threadpool) and async (asyncpg) database paths.
+
+For each mode a single worker is started with DB_ASYNC set accordingly,
+`--clients` coroutines issue GETs against `--paths` for `--seconds`, and the
+completed request count is reported. Run against a database seeded with
+src/post_fake_data.py:
+
+    python -m benchmarks.async_throughput --clients 500 --seconds 30
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def start_server(port, async_db):
+    env = dict(os.environ, DB_ASYNC="1" if async_db else "0")
+    # an overloaded client can leave a pooled connection idle past uvicorn's
+    # 5 s default, and the server closing it mid-reuse would count as an error
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.api.server:app", "--port", str(port),
+         "--workers", "1", "--log-level", "warning", "--timeout-keep-alive", "120"],
+        env=env,
+    )
+
+
+async def wait_until_up(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while True:
+            try:
+                await client.get("/")
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+
+
+async def load(base_url, paths, clients, seconds):
+    counts = {"ok": 0, "error": 0}
+    deadline = time.monotonic() + seconds
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def worker(n):
+            i = n
+            while time.monotonic() < deadline:
+                try:
+                    response = await client.get(paths[i % len(paths)])
+                    counts["ok" if response.status_code < 500 else "error"] += 1
+                except httpx.HTTPError:
+                    counts["error"] += 1
+                i += 1
+
+        start = time.monotonic()
+        await asyncio.gather(*(worker(n) for n in range(clients)))
+        elapsed = time.monotonic() - start
+    return counts, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--paths", nargs="+", default=["/recipes/1", "/recipes/?limit=20", "/ingredients/1"])
+    parser.add_argument("--modes", nargs="+", choices=["sync", "async"], default=["sync", "async"])
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    print(f"{'mode':>6} {'clients':>8} {'requests':>9} {'errors':>7} {'req/s':>9}")
+    for mode in args.modes:
+        server = start_server(args.port, async_db=mode == "async")
+        try:
+            asyncio.run(wait_until_up(base_url))
+            counts, elapsed = asyncio.run(load(base_url, args.paths, args.clients, args.seconds))
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{mode:>6} {args.clients:>8} {counts['ok']:>9} {counts['error']:>7} {counts['ok'] / elapsed:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
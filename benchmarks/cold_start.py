@@ -0,0 +1,61 @@
+"""
+Cold start benchmark: time from a fresh interpreter importing the app to its
+first response, the cost a serverless instance pays before serving traffic.
+
+Each run starts a new python process that imports src.api.server, enters a
+TestClient, which runs the startup events like a server would (loading the
+reference data, so a database is needed), and issues one request. It reports
+the time to import, to finish startup and to the first response, each
+counted from the start. `/` itself needs no database; pass e.g.
+`--path /recipes/1` to include a query.
+
+    python -m benchmarks.cold_start --runs 20
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+from src.api.server import app
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(app) as client:
+    started = time.perf_counter()
+    response = client.get(sys.argv[1])
+    responded = time.perf_counter()
+print(json.dumps({
+    "status": response.status_code,
+    "import_ms": (imported - start) * 1000,
+    "startup_ms": (started - start) * 1000,
+    "first_response_ms": (responded - start) * 1000,
+}))
+"""
+
+
+def run_once(path):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, path], check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--path", default="/")
+    args = parser.parse_args()
+
+    samples = [run_once(args.path) for _ in range(args.runs)]
+    statuses = sorted({sample["status"] for sample in samples})
+    for key in ("import_ms", "startup_ms", "first_response_ms"):
+        values = [sample[key] for sample in samples]
+        print(f"{key:>18}: median {statistics.median(values):8.1f}  min {min(values):8.1f}  max {max(values):8.1f}")
+    print(f"{'status codes':>18}: {statuses}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Password verifications/sec through src.passwords across worker counts.
+
+For each `--workers` value a PasswordHasher with that many processes (0 is
+the thread executor) verifies a stored hash from `--concurrency` concurrent
+callers for `--seconds`, and the completed and rejected (pool full) counts
+are reported. Needs no database:
+
+    python -m benchmarks.login_throughput --workers 0 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from src.passwords import PasswordHasher, HasherBusy, LEGACY_ITERATIONS
+
+
+async def load(hasher, stored, concurrency, seconds):
+    counts = {"ok": 0, "rejected": 0}
+    deadline = time.monotonic() + seconds
+
+    async def caller():
+        while time.monotonic() < deadline:
+            try:
+                await hasher.verify("correct horse battery staple", stored)
+                counts["ok"] += 1
+            except HasherBusy:
+                counts["rejected"] += 1
+                await asyncio.sleep(0.001)
+
+    start = time.monotonic()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    return counts, time.monotonic() - start
+
+
+async def run(workers, args):
+    hasher = PasswordHasher(
+        iterations=args.iterations, workers=workers, max_pending=args.max_pending or max(workers, 1) * 8
+    )
+    try:
+        stored = await hasher.hash("correct horse battery staple")  # also starts the pool
+        return await load(hasher, stored, args.concurrency, args.seconds)
+    finally:
+        hasher.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    cores = os.cpu_count() or 1
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({0, 1, max(cores // 2, 1), cores}))
+    parser.add_argument("--iterations", type=int, default=LEGACY_ITERATIONS)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--max-pending", type=int, default=0, help="default: 8 per worker")
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{cores} cores, {args.iterations} iterations, {args.concurrency} concurrent callers")
+    print(f"{'workers':>8} {'verified':>9} {'rejected':>9} {'logins/s':>9}")
+    for workers in args.workers:
+        counts, elapsed = asyncio.run(run(workers, args))
+        print(f"{workers:>8} {counts['ok']:>9} {counts['rejected']:>9} {counts['ok'] / elapsed:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Build time and memory of the "users who favorited this also favorited"
+index (src.similar_favorites), plus lookup and incremental update latency.
+
+`--users` users favorite on average `--favorites-per-user` of `--recipes`
+recipes (geometric per user counts, Zipf-like recipe popularity). The seed
+data of src/post_fake_data.py is 100k users x 100k recipes at about one
+favorite per user. Needs no database:
+
+    python -m benchmarks.similar_favorites --favorites-per-user 1 10 50
+"""
+import argparse
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+
+from src.similar_favorites import CoFavoriteIndex
+
+
+def synthetic_favorites(users, recipes, per_user, rng):
+    counts = np.minimum(rng.geometric(1 / per_user, size=users), recipes)
+    user_column = np.repeat(np.arange(1, users + 1, dtype=np.int32), counts)
+    weights = 1.0 / np.arange(1, recipes + 1)
+    # repeats within a user are dropped by the index, as by the primary key
+    recipe_column = rng.choice(recipes, size=len(user_column), p=weights / weights.sum()).astype(np.int32) + 1
+    return user_column, recipe_column
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--favorites-per-user", type=float, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--max-user-favorites", type=int, default=1000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{args.users} users, {args.recipes} recipes, top {args.top_k}")
+    print(f"{'per user':>9} {'favorites':>10} {'build s':>8} {'peak MiB':>9} {'index MiB':>10} "
+          f"{'lookup us':>10} {'update us':>10}")
+    for per_user in args.favorites_per_user:
+        rng = np.random.default_rng(args.seed)
+        users, recipes = synthetic_favorites(args.users, args.recipes, per_user, rng)
+        index = CoFavoriteIndex(float("inf"), args.top_k, args.max_user_favorites)
+
+        # numpy reports its allocations to tracemalloc
+        tracemalloc.start()
+        index.build_arrays(users, recipes)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        lookups = []
+        for recipe_id in rng.integers(1, args.recipes + 1, size=args.lookups).tolist():
+            started = time.perf_counter()
+            index.similar(recipe_id)
+            lookups.append(time.perf_counter() - started)
+        updates = []
+        for user_id, recipe_id in zip(rng.integers(1, args.users + 1, size=args.lookups).tolist(),
+                                      rng.integers(1, args.recipes + 1, size=args.lookups).tolist()):
+            started = time.perf_counter()
+            index.record(user_id, [recipe_id], True)
+            updates.append(time.perf_counter() - started)
+
+        stats = index.stats()
+        print(f"{per_user:>9g} {len(users):>10} {stats['build_seconds']:>8.2f} {peak / 2 ** 20:>9.0f} "
+              f"{stats['bytes'] / 2 ** 20:>10.1f} {statistics.median(lookups) * 1e6:>10.1f} "
+              f"{statistics.median(updates) * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
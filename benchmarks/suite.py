@@ -0,0 +1,414 @@
+"""
+Latency and throughput of every route in src/api/recipes.py, ingredients.py
+and users.py, written as JSON so that commits can be compared.
+
+`run` starts one uvicorn worker against the database configured by the
+POSTGRES_* variables. For each `--scale` it first reseeds that database with
+src/post_fake_data.py, which drops every table, and builds the recipe
+documents; without `--scale` the database is used as it is. Reseeding refuses
+any host other than localhost, 127.0.0.1 or a unix socket unless `--yes-drop`
+is given. Every scenario then sends `--requests` requests
+(fewer for the export and bulk import) from `--concurrency` clients after
+`--warmup` unmeasured ones. Parameters are drawn like real traffic: popular
+recipes and ingredients far more often than the rest, most listings on their
+first page, pantries and prefixes taken from real ingredient names. Writes
+made by earlier scenarios (added recipes, favorites, new users) are what the
+later ones modify, unfavorite and log in with. The same `--seed` sends the
+same requests.
+
+    python -m benchmarks.suite run --scale 0.1 1 --output before.json
+    python -m benchmarks.suite run --scale 0.1 1 --output after.json
+    python -m benchmarks.suite compare before.json after.json
+
+`compare` prints the change of p50/p95/p99 and requests/s per scenario and
+exits with status 1 if any got worse by more than `--threshold` percent.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+import sqlalchemy
+
+from benchmarks.async_throughput import start_server, wait_until_up
+from src import database as db
+from src import recipe_documents
+
+PERCENTILES = (50, 95, 99)
+# scenarios that move a lot of data per request are capped at this many
+CAPPED_REQUESTS = {"export_ndjson": 5, "export_csv": 5, "bulk_import": 20}
+BULK_IMPORT_LINES = 100
+SORTS = ["recipe", "time", "number_of_favorites", "cost", "calories"]
+
+
+class Workload:
+    """
+    What the scenarios draw from: the size of the seeded tables, some real
+    names, and what earlier scenarios wrote.
+    """
+
+    def __init__(self, conn, rng, tag):
+        self.rng = rng
+        # keeps names written by this run apart from earlier runs'
+        self.tag = tag
+        self.recipes, self.users, self.ingredients = conn.execute(sqlalchemy.text(
+            "SELECT (SELECT max(recipe_id) FROM recipes), (SELECT max(user_id) FROM users), "
+            "(SELECT max(ingredient_id) FROM ingredients)"
+        )).one()
+        self.cuisine_ids = conn.execute(sqlalchemy.text("SELECT cuisine_type_id FROM cuisine_type")).scalars().all()
+        self.cuisines = conn.execute(sqlalchemy.text("SELECT cuisine_type FROM cuisine_type")).scalars().all()
+        self.meal_type_ids = conn.execute(sqlalchemy.text("SELECT meal_type_id FROM meal_type")).scalars().all()
+        self.meal_types = conn.execute(sqlalchemy.text("SELECT meal_type FROM meal_type")).scalars().all()
+        self.ingredient_names = conn.execute(sqlalchemy.text(
+            "SELECT ingredient_name FROM ingredients ORDER BY ingredient_id LIMIT 1000"
+        )).scalars().all()
+        self.added_recipes = []
+        self.favorites = []
+        self.bulk_favorites = []
+        self.registered = []
+        self.counter = 0
+
+    def popular(self, n):
+        """
+        An id in 1..n, Zipf distributed over ranks scattered across the ids,
+        so a few ids take most requests as in real traffic.
+        """
+        rank = min(int(self.rng.zipf(1.2)), n)
+        return (rank - 1) * 7919 % n + 1
+
+    def recipe_id(self):
+        return self.popular(self.recipes)
+
+    def ingredient_id(self):
+        return self.popular(self.ingredients)
+
+    def next_name(self, prefix):
+        self.counter += 1
+        return f"{prefix} {self.tag} {self.counter}"
+
+    def new_recipe(self):
+        ingredient_ids = sorted({self.ingredient_id() for _ in range(int(self.rng.integers(3, 11)))})
+        return {
+            "recipe": self.next_name("Bench recipe"),
+            "cuisine_type_id": [int(self.rng.choice(self.cuisine_ids))],
+            "meal_type_id": [int(self.rng.choice(self.meal_type_ids))],
+            "calories": int(self.rng.integers(100, 1500)),
+            "time": int(self.rng.integers(5, 120)),
+            "recipe_instructions": "Mix everything and cook until done.",
+            "url": "https://example.com/recipe",
+            "ingredients": [
+                {"ingredient_id": ingredient_id, "unit_type": "g", "amount": int(self.rng.integers(1, 500)),
+                 "ingredient_price_usd": round(float(self.rng.random() * 10), 2)}
+                for ingredient_id in ingredient_ids
+            ],
+        }
+
+
+def list_recipes(w):
+    params = {"limit": 50, "sort": str(w.rng.choice(SORTS))}
+    if w.rng.random() < 0.3:
+        params["cuisine"] = str(w.rng.choice(w.cuisines))
+    if w.rng.random() < 0.2:
+        params["meal_type"] = str(w.rng.choice(w.meal_types))
+    if w.rng.random() < 0.2:
+        params["search"] = str(w.rng.choice(w.ingredient_names))
+    if w.rng.random() < 0.1:
+        params["max_cost"] = int(w.rng.integers(500, 5000))
+    if w.rng.random() < 0.1:
+        params["max_calories"] = int(w.rng.integers(200, 1000))
+    # most people never leave the first page
+    if w.rng.random() < 0.1:
+        params["offset"] = int(w.rng.choice([50, 100, 500]))
+    return "GET", "/recipes/", {"params": params}
+
+
+def add_recipe(w):
+    recipe = w.new_recipe()
+    return "POST", "/recipes/", {"json": recipe}, lambda response: w.added_recipes.append(
+        (response.json()["recipe_id"], recipe["ingredients"][0]["ingredient_id"])
+    )
+
+
+def bulk_import(w):
+    body = "".join(json.dumps(w.new_recipe()) + "\n" for _ in range(BULK_IMPORT_LINES))
+    return "POST", "/recipes/bulk", {"content": body}
+
+
+def modify_recipe(w):
+    if not w.added_recipes:
+        return "PUT", f"/recipes/{w.recipe_id()}/", {"params": {"old_ingredient_id": 1, "new_ingredient_id": 1}}
+    recipe_id, ingredient_id = w.added_recipes[int(w.rng.integers(len(w.added_recipes)))]
+    return "PUT", f"/recipes/{recipe_id}/", {"params": {
+        "old_ingredient_id": ingredient_id, "new_ingredient_id": ingredient_id,
+        "new_unit_type": "g", "new_amount": str(int(w.rng.integers(1, 500))),
+        "new_ingredient_cost": round(float(w.rng.random() * 10), 2),
+    }}
+
+
+def favorite(w):
+    pair = (w.popular(w.users), w.recipe_id())
+    w.favorites.append(pair)
+    return "PUT", "/favorited_recipes/", {"params": {"user_id": pair[0], "recipe_id": pair[1]}}
+
+
+def unfavorite(w):
+    user_id, recipe_id = w.favorites.pop() if w.favorites else (w.popular(w.users), w.recipe_id())
+    return "DELETE", "/favorited_recipes/", {"params": {"user_id": user_id, "recipe_id": recipe_id}}
+
+
+def bulk_favorite(w):
+    user_id = w.popular(w.users)
+    recipe_ids = sorted({w.recipe_id() for _ in range(20)})
+    w.bulk_favorites.append((user_id, recipe_ids))
+    return "PUT", "/favorited_recipes/bulk", {"params": {"user_id": user_id}, "json": {"recipe_ids": recipe_ids}}
+
+
+def bulk_unfavorite(w):
+    user_id, recipe_ids = w.bulk_favorites.pop() if w.bulk_favorites else (w.popular(w.users), [w.recipe_id()])
+    return "DELETE", "/favorited_recipes/bulk", {"params": {"user_id": user_id}, "json": {"recipe_ids": recipe_ids}}
+
+
+def register_user(w):
+    login = {"username": w.next_name("bench").replace(" ", "_"), "password": "correct horse battery staple"}
+    w.registered.append(login)
+    return "POST", "/register_user/", {"json": login}
+
+
+def login_user(w):
+    return "POST", "/login_user/", {"json": w.registered[int(w.rng.integers(len(w.registered)))]}
+
+
+def autocomplete(w):
+    name = str(w.rng.choice(w.ingredient_names))
+    return "GET", "/ingredients/autocomplete", {"params": {"prefix": name[:int(w.rng.integers(1, 5))]}}
+
+
+# name -> builder of one request: (method, path, httpx kwargs[, callback on a 2xx response]).
+# Run in this order; the later writes use what the earlier ones wrote.
+SCENARIOS = {
+    "get_recipe": lambda w: ("GET", f"/recipes/{w.recipe_id()}", {}),
+    "list_recipes": list_recipes,
+    "cookable": lambda w: ("GET", "/recipes/cookable", {"params": {
+        "ingredient_id": sorted({w.ingredient_id() for _ in range(int(w.rng.integers(5, 21)))}),
+        "max_missing": int(w.rng.choice([0, 1, 2])),
+    }}),
+    "trending": lambda w: ("GET", "/recipes/trending", {"params": {"limit": int(w.rng.choice([10, 20, 50]))}}),
+    "similar_by_favorites": lambda w: ("GET", f"/recipes/{w.recipe_id()}/similar-by-favorites", {}),
+    "export_ndjson": lambda w: ("GET", "/recipes/export", {"params": {"format": "ndjson"}}),
+    "export_csv": lambda w: ("GET", "/recipes/export", {"params": {"format": "csv"}}),
+    "add_recipe": add_recipe,
+    "bulk_import": bulk_import,
+    "modify_recipe": modify_recipe,
+    "favorite": favorite,
+    "unfavorite": unfavorite,
+    "bulk_favorite": bulk_favorite,
+    "bulk_unfavorite": bulk_unfavorite,
+    "list_favorites": lambda w: ("GET", "/favorited_recipes/", {"params": {"user_id": w.popular(w.users)}}),
+    "autocomplete": autocomplete,
+    "get_ingredient": lambda w: ("GET", f"/ingredients/{w.ingredient_id()}", {"params": {"limit": 50}}),
+    "stream_ingredient": lambda w: ("GET", f"/ingredients/{w.ingredient_id()}", {"params": {"stream": "true"}}),
+    "add_ingredient": lambda w: ("POST", "/ingredients/", {"json": {"ingredient_name": w.next_name("bench ingredient")}}),
+    "register_user": register_user,
+    "login_user": login_user,
+}
+
+
+async def drive(client, workload, build, count, concurrency):
+    """
+    Sends `count` requests built by `build`, `concurrency` at a time, and
+    returns their latencies in ms, the count per status and the wall time.
+    """
+    latencies = []
+    statuses = {}
+    # built up front, in order, so the requests don't depend on timing
+    pending = iter([build(workload) for _ in range(count)])
+
+    async def worker():
+        for method, path, kwargs, *callback in pending:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                status = str(response.status_code)
+            except httpx.HTTPError:
+                response, status = None, "transport error"
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+            if callback and response is not None and response.is_success:
+                callback[0](response)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - started
+
+
+async def run_scenarios(base_url, workload, args):
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=600) as client:
+        for name, build in SCENARIOS.items():
+            if name in args.skip:
+                continue
+            count = min(args.requests, CAPPED_REQUESTS.get(name, args.requests))
+            warmup = min(args.warmup, count // 5)
+            await drive(client, workload, build, warmup, args.concurrency)
+            latencies, statuses, elapsed = await drive(client, workload, build, count, args.concurrency)
+
+            errors = sum(n for status, n in statuses.items() if not status.isdigit() or int(status) >= 500)
+            percentiles = np.percentile(latencies, PERCENTILES).tolist()
+            results[name] = dict(
+                {f"p{p}_ms": round(value, 3) for p, value in zip(PERCENTILES, percentiles)},
+                requests=count,
+                errors=errors,
+                statuses=statuses,
+                mean_ms=round(statistics.mean(latencies), 3),
+                max_ms=round(max(latencies), 3),
+                throughput_rps=round(count / elapsed, 2),
+            )
+            row = results[name]
+            print(f"{name:<22} {count:>8} {errors:>6} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} "
+                  f"{row['p99_ms']:>9.2f} {row['throughput_rps']:>9.1f}")
+    return results
+
+
+LOCAL_HOSTS = {None, "", "localhost", "127.0.0.1", "::1"}
+
+
+def seed(scale, seed_value, yes_drop=False):
+    url = db.database_connection_url()
+    host = sqlalchemy.engine.make_url(url).host
+    if host not in LOCAL_HOSTS and not host.startswith("/") and not yes_drop:
+        sys.exit(f"refusing to reseed {host}: seeding drops every table. Point POSTGRES_SERVER at a local "
+                 "database, or pass --yes-drop if this one may be wiped.")
+    subprocess.run([sys.executable, "src/post_fake_data.py", "--scale", str(scale), "--seed", str(seed_value),
+                    "--url", url], check=True)
+    started = time.perf_counter()
+    written = recipe_documents.rebuild()
+    print(f"built {written} recipe documents in {time.perf_counter() - started:.1f} s")
+
+
+def table_rows(conn):
+    tables = ["recipes", "users", "ingredients", "ingredient_quantities", "favorited_recipes"]
+    return {table: conn.execute(sqlalchemy.text(f"SELECT count(*) FROM {table}")).scalar_one() for table in tables}
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], check=True, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    check=True, capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def run(args):
+    commit, dirty = git_revision()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "mode": args.mode,
+        "settings": {"requests": args.requests, "warmup": args.warmup, "concurrency": args.concurrency,
+                     "seed": args.seed},
+        "runs": [],
+    }
+    base_url = f"http://127.0.0.1:{args.port}"
+    for scale in args.scale or [None]:
+        if scale is not None:
+            seed(scale, args.seed, args.yes_drop)
+        with db.get_engine().connect() as conn:
+            rows = table_rows(conn)
+            workload = Workload(conn, np.random.default_rng(args.seed), tag=f"{int(time.time()):x}")
+
+        print(f"scale {scale if scale is not None else 'as is'}: "
+              + ", ".join(f"{count} {table}" for table, count in rows.items()))
+        print(f"{'scenario':<22} {'requests':>8} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9}")
+        server = start_server(args.port, async_db=args.mode == "async")
+        try:
+            asyncio.run(wait_until_up(base_url))
+            scenarios = asyncio.run(run_scenarios(base_url, workload, args))
+        finally:
+            server.terminate()
+            server.wait()
+        report["runs"].append({"scale": scale, "rows": rows, "scenarios": scenarios})
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.output}")
+
+
+def change(old, new):
+    return (new - old) / old * 100 if old else 0.0
+
+
+def compare(args):
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    print(f"before {before['commit']}{' (dirty)' if before['dirty'] else ''}, "
+          f"after {after['commit']}{' (dirty)' if after['dirty'] else ''}")
+
+    regressions = []
+    before_runs = {run["scale"]: run for run in before["runs"]}
+    for after_run in after["runs"]:
+        before_run = before_runs.get(after_run["scale"])
+        if before_run is None:
+            continue
+        print(f"scale {after_run['scale']}")
+        print(f"{'scenario':<22} " + " ".join(f"{f'p{p} %':>8}" for p in PERCENTILES) + f" {'req/s %':>8}")
+        for name, new in after_run["scenarios"].items():
+            old = before_run["scenarios"].get(name)
+            if old is None:
+                continue
+            latency = [change(old[f"p{p}_ms"], new[f"p{p}_ms"]) for p in PERCENTILES]
+            throughput = change(old["throughput_rps"], new["throughput_rps"])
+            worse = max(latency) > args.threshold or -throughput > args.threshold
+            if worse:
+                regressions.append((after_run["scale"], name))
+            print(f"{name:<22} " + " ".join(f"{value:>+8.1f}" for value in latency)
+                  + f" {throughput:>+8.1f}" + ("  worse" if worse else ""))
+
+    if regressions:
+        print(f"{len(regressions)} scenarios worse by more than {args.threshold}%")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="seed, benchmark every route and write the results")
+    run_parser.add_argument("--scale", type=float, nargs="+", help="reseed at each scale; default: use the database as is")
+    run_parser.add_argument("--requests", type=int, default=200)
+    run_parser.add_argument("--warmup", type=int, default=10)
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    run_parser.add_argument("--port", type=int, default=8765)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--yes-drop", action="store_true",
+                            help="allow --scale to drop and reseed a database that is not on this machine")
+    run_parser.add_argument("--skip", nargs="+", default=[], choices=list(SCENARIOS))
+    run_parser.add_argument("--output", default="bench_results.json")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--threshold", type=float, default=20)
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,72 +1,142 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from enum import Enum
+from typing import Optional
+import json
 import sqlalchemy
 from sqlalchemy import desc, func, select
 from pydantic import BaseModel
-from src import database as db
+from src import database as db, pagination
+from src.autocomplete import ingredient_autocomplete
+from src.reference_data import registry
 from fastapi.params import Query
 
 
 router = APIRouter()
 
 
+@router.get("/ingredients/autocomplete", tags=["ingredients"])
+async def autocomplete_ingredients(prefix: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    ):
+    """
+    This endpoint suggests ingredients whose name starts with `prefix`,
+    ignoring case, for type-ahead in the recipe editor. For each ingredient
+    it returns:
+    * `ingredient_id`: the internal id of the ingredient.
+    * `ingredient_name`: The name of the ingredient.
+    * `recipe_count`: The number of recipes that use the ingredient.
+
+    Up to `limit` ingredients are returned, most used first. Suggestions are
+    served from memory, so usage counts may be a few minutes old.
+    """
+    await ingredient_autocomplete.ensure_fresh()
+
+    return {"ingredients": [
+        {"ingredient_id": ingredient_id, "ingredient_name": name, "recipe_count": recipe_count}
+        for ingredient_id, name, recipe_count in ingredient_autocomplete.search(prefix, limit)
+    ]}
+
+
 @router.get("/ingredients/{ingr_id}", tags=["ingredients"])
-def get_ingredients(ingr_id: int):
+async def get_ingredients(ingr_id: int,
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    ):
     """
     This endpoint returns a single ingredient by its identifier. For each ingredient
     it returns:
     * `ingredient_id`: the internal id of the ingredient. Can be used to query the
       `/ingredients/{id}` endpoint.
     * `ingredient`: The name of the ingredient 
-    * `recipes`: A list of the recipes that contain the ingredient.
+    * `total_recipes`: The number of recipes that contain the ingredient.
+    * `recipes`: A page of the recipes that contain the ingredient, in recipe_id order.
+    * `next_cursor`: Pass as `cursor` to get the next page; null on the last page.
 
+    The `limit` query parameter specifies the maximum number of recipes per page.
+
+    With `stream=true` the response is NDJSON instead: a first line with the
+    ingredient and `total_recipes`, then one line per recipe, all of them,
+    written as they are read from the database.
     """
-    stmt = (
-        sqlalchemy.select(
-            db.ingredients.c.ingredient_id,
-            db.ingredients.c.ingredient_name,
-            db.recipes.c.recipe_id,
-            db.recipes.c.recipe_name
-        )
-        .select_from(
-            db.ingredients
-            .outerjoin(
-                db.ingredient_quantities,
-                db.ingredients.c.ingredient_id == db.ingredient_quantities.c.ingredient_id
-            )
-            .outerjoin(
-                db.recipes,
-                db.recipes.c.recipe_id == db.ingredient_quantities.c.recipe_id
-            )
-        )
-        .where(db.ingredients.c.ingredient_id == ingr_id)
+    after_id = None
+    if cursor:
+        try:
+            cursor_ingr_id, after_id = pagination.decode_cursor(cursor, "ingredient_recipes", (int,))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if cursor_ingr_id != ingr_id:
+            raise HTTPException(status_code=400, detail="cursor does not match the requested ingredient")
+
+    quantities = db.ingredient_quantities
+    total_recipes = (
+        sqlalchemy.select(sqlalchemy.func.count())
+        .select_from(quantities)
+        .where(quantities.c.ingredient_id == ingr_id)
+        .scalar_subquery()
+    )
+    ingredient_stmt = sqlalchemy.select(
+        db.ingredients.c.ingredient_id,
+        db.ingredients.c.ingredient_name,
+        total_recipes.label("total_recipes"),
+    ).where(db.ingredients.c.ingredient_id == ingr_id)
+
+    # seeks on ix_ingredient_quantities_ingredient_id_recipe_id
+    recipes_stmt = (
+        sqlalchemy.select(db.recipes.c.recipe_id, db.recipes.c.recipe_name)
+        .select_from(quantities.join(db.recipes, db.recipes.c.recipe_id == quantities.c.recipe_id))
+        .where(quantities.c.ingredient_id == ingr_id)
+        .order_by(quantities.c.recipe_id)
     )
+    if after_id is not None:
+        recipes_stmt = recipes_stmt.where(quantities.c.recipe_id > after_id)
 
-    with db.engine.connect() as conn:
-        result = conn.execute(stmt)
-        if result.rowcount == 0:
+    if stream:
+        ingredient = await db.run(lambda conn: conn.execute(ingredient_stmt).first())
+        if ingredient is None:
             raise HTTPException(status_code=404, detail="Ingredient not found")
-        
-        ingredient_data = {}
-        recipe_list = []
-        for row in result:
-            if "ingredient_id" not in ingredient_data:
-                ingredient_data["ingredient_id"] = row.ingredient_id
-                ingredient_data["ingredient_name"] = row.ingredient_name
-            
-            recipe_list.append({"recipe_id": row.recipe_id, "recipe_name": row.recipe_name})
-        
-        ingredient_data["recipes"] = recipe_list
+        return StreamingResponse(_stream_ingredient(ingredient, recipes_stmt), media_type="application/x-ndjson")
+
+    def fetch(conn):
+        ingredient = conn.execute(ingredient_stmt).first()
+        if ingredient is None:
+            return None, []
+        return ingredient, conn.execute(recipes_stmt.limit(limit + 1)).fetchall()
+
+    ingredient, rows = await db.run(fetch)
+    if ingredient is None:
+        raise HTTPException(status_code=404, detail="Ingredient not found")
+
+    ingredient_data = {
+        "ingredient_id": ingredient.ingredient_id,
+        "ingredient_name": ingredient.ingredient_name,
+        "total_recipes": ingredient.total_recipes,
+        "recipes": [{"recipe_id": row.recipe_id, "recipe_name": row.recipe_name} for row in rows[:limit]],
+        "next_cursor": None,
+    }
+    if len(rows) > limit:
+        ingredient_data["next_cursor"] = pagination.encode_cursor("ingredient_recipes", ingr_id, rows[limit - 1].recipe_id)
 
     return ingredient_data
 
 
+async def _stream_ingredient(ingredient, recipes_stmt):
+    yield json.dumps({
+        "ingredient_id": ingredient.ingredient_id,
+        "ingredient_name": ingredient.ingredient_name,
+        "total_recipes": ingredient.total_recipes,
+    }) + "\n"
+    async for rows in db.stream(recipes_stmt):
+        yield "".join(json.dumps({"recipe_id": row.recipe_id, "recipe_name": row.recipe_name}) + "\n" for row in rows)
+
+
 class IngredientJson(BaseModel):
     ingredient_name: str
 
 
 @router.post("/ingredients/", tags=["ingredients"])
-def add_ingredient(ingredient: IngredientJson):
+async def add_ingredient(ingredient: IngredientJson):
     """
     This endpoint adds a single ingredient. A new ingredient is represented by its name.
     
@@ -75,24 +145,21 @@ def add_ingredient(ingredient: IngredientJson):
     stmt = sqlalchemy.select(
         db.ingredients.c.ingredient_id).where(db.ingredients.c.ingredient_name == ingredient.ingredient_name)
 
-    with db.engine.begin() as conn:
-      check_valid = conn.execute(stmt)
-      if check_valid .rowcount > 0:
-        for row in check_valid:
-            ingredient_id = row.ingredient_id
-        return {"ingredient_id": ingredient_id} 
-
+    def add(conn):
+      existing = conn.execute(stmt).fetchall()
+      if len(existing) > 0:
+        return existing[-1].ingredient_id, False
 
-      conn.execute(
-              sqlalchemy.insert(db.ingredients),
-              [
-                  {"ingredient_name": ingredient.ingredient_name}
-              ],
+      result = conn.execute(
+              sqlalchemy.insert(db.ingredients).values(ingredient_name=ingredient.ingredient_name)
+              .returning(db.ingredients.c.ingredient_id)
       )
+      return result.scalar_one(), True
 
-      stmt = sqlalchemy.select(db.ingredients.c.ingredient_id).where(db.ingredients.c.ingredient_name == ingredient.ingredient_name)
-      result = conn.execute(stmt)
-      for row in result:
-         ingredient_id = row.ingredient_id
+    ingredient_id, created = await db.run(add)
+    if not created:
+        return {"ingredient_id": ingredient_id} 
 
+    registry.add_ingredient(ingredient_id, ingredient.ingredient_name)
+    ingredient_autocomplete.add(ingredient_id, ingredient.ingredient_name)
     return {"ingredient_id": ingredient_id} 
@@ -1,7 +1,13 @@
 from fastapi import APIRouter
 import os
-import pkg_resources
 import sys
+from src import database as db
+from src.autocomplete import ingredient_autocomplete
+from src.cache import recipe_cache
+from src.cookable import cookable_recipes
+from src.passwords import hasher
+from src.similar_favorites import similar_by_favorites
+from src.trending import trending_recipes
 
 router = APIRouter()
 
@@ -24,6 +30,10 @@ def version():
 
 @router.get("/pkgsize/")
 def get_pkgsize():
+    # pkg_resources scans every installed distribution on import, so only
+    # pay for it when this debug route is actually hit
+    import pkg_resources
+
     dists = [d for d in pkg_resources.working_set]
 
     message = []
@@ -44,3 +54,38 @@ def get_pkgsize():
 
     message = sorted(message, key=lambda d: d["size_in_mb"], reverse=True)
     return {"message": message}
+
+
+@router.get("/cachestats/")
+def get_cache_stats():
+    return {"recipe_cache": recipe_cache.stats()}
+
+
+@router.get("/poolstats/")
+def get_pool_stats():
+    return db.pool_stats()
+
+
+@router.get("/hashstats/")
+def get_hash_stats():
+    return hasher.stats()
+
+
+@router.get("/autocompletestats/")
+def get_autocomplete_stats():
+    return ingredient_autocomplete.stats()
+
+
+@router.get("/cookablestats/")
+def get_cookable_stats():
+    return cookable_recipes.stats()
+
+
+@router.get("/similarfavoritesstats/")
+def get_similar_favorites_stats():
+    return similar_by_favorites.stats()
+
+
+@router.get("/trendingstats/")
+def get_trending_stats():
+    return trending_recipes.stats()
@@ -1,14 +1,26 @@
-import datetime
 from fastapi import APIRouter, HTTPException
 from enum import Enum
 from src import database as db
+from src import favorite_counts
+from src import pagination
+from src import recipe_documents
+from src.cache import recipe_cache
+from src.cookable import cookable_recipes
+from src.reference_data import registry
+from src.similar_favorites import similar_by_favorites
+from src.trending import trending_recipes
 from fastapi.params import Query
 import sqlalchemy
 from sqlalchemy import desc, func, select
-from fastapi import HTTPException, Body
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by, insert
+from fastapi import HTTPException, Body, Request
+from fastapi.responses import StreamingResponse
 from typing import Optional
 from typing import List
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError, conlist
+import csv
+import io
+import json
 from sqlalchemy.sql.sqltypes import Integer, String
 from psycopg2.errors import UniqueViolation
 
@@ -16,8 +28,214 @@ from psycopg2.errors import UniqueViolation
 router = APIRouter()
 
 
+def _get_recipe_document(conn, recipe_id):
+    document = recipe_documents.get(conn, recipe_id)
+    if document is None:
+        # not built yet (new recipe before a backfill): build it now
+        document = recipe_documents.refresh(conn, [recipe_id]).get(recipe_id)
+    return document
+
+
+def _cookable_details(conn, recipe_ids, have):
+    """
+    Returns the names of the given recipes and, for each, the ingredients it
+    uses that are not in `have`, both keyed by recipe id.
+    """
+    names = dict(conn.execute(
+        sqlalchemy.select(db.recipes.c.recipe_id, db.recipes.c.recipe_name)
+        .where(db.recipes.c.recipe_id.in_(recipe_ids))
+    ).all())
+    missing = {recipe_id: [] for recipe_id in recipe_ids}
+    rows = conn.execute(
+        sqlalchemy.select(
+            db.ingredient_quantities.c.recipe_id,
+            db.ingredients.c.ingredient_id,
+            db.ingredients.c.ingredient_name,
+        )
+        .join(db.ingredients, db.ingredients.c.ingredient_id == db.ingredient_quantities.c.ingredient_id)
+        .where(db.ingredient_quantities.c.recipe_id.in_(recipe_ids))
+        .where(db.ingredient_quantities.c.ingredient_id.not_in(have))
+        .order_by(db.ingredient_quantities.c.recipe_id, db.ingredients.c.ingredient_id)
+    )
+    for recipe_id, ingredient_id, ingredient_name in rows:
+        missing[recipe_id].append({"ingredient_id": ingredient_id, "ingredient_name": ingredient_name})
+    return names, missing
+
+
+@router.get("/recipes/cookable", tags=["recipes"])
+async def find_cookable_recipes(ingredient_id: List[int] = Query(...),
+    max_missing: int = Query(0, ge=0, le=10),
+    limit: int = Query(20, ge=1, le=100),
+    ):
+    """
+    This endpoint finds the recipes that can be made with the ingredients
+    you have. Pass each ingredient as an `ingredient_id` query parameter
+    (`?ingredient_id=1&ingredient_id=2`). With `max_missing` above 0 recipes
+    that need up to that many other ingredients are included too. For each
+    recipe it returns:
+    * `recipe_id`: the internal id of the recipe. Can be used to query the
+      `/recipes/{recipe_id}` endpoint.
+    * `recipe_name`: The name of the recipe.
+    * `matched_ingredients`: How many of the recipe's ingredients you have.
+    * `total_ingredients`: How many ingredients the recipe uses.
+    * `missing_ingredients`: The ingredients of the recipe you don't have.
+
+    Up to `limit` recipes are returned, the ones you have the largest share
+    of the ingredients for first. Matches are found in memory, so recipes
+    added outside the API may take a few minutes to show up.
+    """
+    await cookable_recipes.ensure_fresh()
+
+    found = cookable_recipes.search(ingredient_id, max_missing, limit)
+    if len(found) == 0:
+        return {"recipes": []}
+    names, missing = await db.run(_cookable_details, [recipe_id for recipe_id, _, _ in found], ingredient_id)
+    return {"recipes": [
+        {"recipe_id": recipe_id, "recipe_name": names[recipe_id], "matched_ingredients": matched,
+         "total_ingredients": total, "missing_ingredients": missing[recipe_id]}
+        for recipe_id, matched, total in found
+        # a recipe may have been deleted since the index was built
+        if recipe_id in names
+    ]}
+
+
+@router.get("/recipes/trending", tags=["recipes"])
+async def get_trending_recipes(limit: int = Query(20, ge=1, le=100)):
+    """
+    This endpoint returns the recipes being favorited the most right now.
+    Every favorite from the last `window_hours` counts towards its recipe's
+    `score`, recent ones more: a favorite counts half as much every
+    `half_life_hours`. For each recipe it returns:
+    * `recipe_id`: the internal id of the recipe. Can be used to query the
+      `/recipes/{recipe_id}` endpoint.
+    * `recipe_name`: The name of the recipe.
+    * `score`: The time decayed number of recent favorites.
+    * `recent_favorites`: The number of favorites within the window.
+
+    Up to `limit` recipes are returned, highest score first. The ranking is
+    recomputed about once a minute.
+    """
+    await trending_recipes.ensure_fresh()
+    return {
+        "window_hours": trending_recipes.window_hours,
+        "half_life_hours": trending_recipes.half_life_hours,
+        "recipes": trending_recipes.top(limit),
+    }
+
+
+class export_formats(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+export_media_types = {
+    export_formats.ndjson: "application/x-ndjson",
+    export_formats.csv: "text/csv",
+}
+
+
+def _json_object(columns):
+    # keys are inlined so json_build_object never sees untyped parameters
+    arguments = []
+    for name, column in columns:
+        arguments += [sqlalchemy.literal_column(f"'{name}'"), column]
+    return sqlalchemy.func.json_build_object(*arguments)
+
+
+def _export_columns():
+    """
+    (name, column) pairs of one exported recipe, in output order. Cuisines,
+    meal types and ingredients are correlated subqueries returning json
+    arrays, so each recipe row is complete as soon as it is read.
+    """
+    quantities = db.ingredient_quantities
+    ingredients = (
+        sqlalchemy.select(sqlalchemy.func.json_agg(aggregate_order_by(_json_object([
+            ("ingredient_id", quantities.c.ingredient_id),
+            ("ingredient_name", db.ingredients.c.ingredient_name),
+            ("amount", quantities.c.amount),
+            ("unit_type", quantities.c.unit_type),
+            ("ingredient_price_usd", quantities.c.ingredient_price_usd),
+        ]), quantities.c.ingredient_id)))
+        .select_from(quantities.join(db.ingredients, db.ingredients.c.ingredient_id == quantities.c.ingredient_id))
+        .where(quantities.c.recipe_id == db.recipes.c.recipe_id)
+        .scalar_subquery()
+    )
+    return [
+        ("recipe_id", db.recipes.c.recipe_id),
+        ("recipe_name", db.recipes.c.recipe_name),
+        ("cuisine_type", recipe_documents.name_list(db.cuisine_type.c.cuisine_type, db.cuisine_type, db.recipe_cuisine_types, "cuisine_type_id")),
+        ("meal_type", recipe_documents.name_list(db.meal_type.c.meal_type, db.meal_type, db.recipe_meal_types, "meal_type_id")),
+        ("prep_time_mins", db.recipes.c.prep_time_mins),
+        ("calories", db.recipes.c.calories),
+        ("total_cost_usd", db.recipes.c.total_cost_usd),
+        ("number_of_favorites", db.recipes.c.number_of_favorites),
+        ("recipe_url", db.recipes.c.recipe_url),
+        ("instructions", db.recipes.c.recipe_instructions),
+        ("ingredients", sqlalchemy.func.coalesce(ingredients, sqlalchemy.literal_column("'[]'::json"))),
+    ]
+
+
+def _export_statement(format):
+    columns = _export_columns()
+    if format == export_formats.ndjson:
+        # Postgres renders each line, so streaming it is only string joins
+        selected = [sqlalchemy.cast(_json_object(columns), sqlalchemy.Text)]
+    else:
+        # the json arrays go into their csv cells as text
+        selected = [
+            sqlalchemy.cast(column, sqlalchemy.Text).label(name) if name in ("cuisine_type", "meal_type", "ingredients")
+            else column.label(name)
+            for name, column in columns
+        ]
+    return sqlalchemy.select(*selected).order_by(db.recipes.c.recipe_id)
+
+
+def _csv_text(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+async def _stream_export(format):
+    stmt = _export_statement(format)
+    if format == export_formats.csv:
+        yield _csv_text([[name for name, _ in _export_columns()]])
+    async for rows in db.stream(stmt):
+        if format == export_formats.ndjson:
+            yield "".join(row[0] + "\n" for row in rows)
+        else:
+            yield _csv_text(rows)
+
+
+@router.get("/recipes/export", tags=["recipes"])
+async def export_recipes(format: export_formats = export_formats.ndjson):
+    """
+    This endpoint returns every recipe, in recipe_id order, for copying the
+    whole catalog. With `format=ndjson` (the default) each line is one
+    recipe; with `format=csv` each row after the header is. For each recipe
+    it returns:
+    * `recipe_id`: the internal id of the recipe.
+    * `recipe_name`: The name of the recipe.
+    * `cuisine_type`: The cuisines of the recipe.
+    * `meal_type`: The meal types of the recipe.
+    * `prep_time_mins`, `calories`, `total_cost_usd`, `number_of_favorites`,
+      `recipe_url` and `instructions`.
+    * `ingredients`: For each ingredient its `ingredient_id`,
+      `ingredient_name`, `amount`, `unit_type` and `ingredient_price_usd`.
+
+    In csv the three lists are json arrays. Recipes are written as they are
+    read from the database, so the response can be consumed before it ends.
+    """
+    return StreamingResponse(
+        _stream_export(format),
+        media_type=export_media_types[format],
+        headers={"Content-Disposition": f'attachment; filename="recipes.{format.value}"'},
+    )
+
+
 @router.get("/recipes/{recipe_id}", tags=["recipes"])
-def get_recipe(recipe_id: int):
+async def get_recipe(recipe_id: int):
     """
     This endpoint returns a single recipe by its identifier. For each recipe
     it returns:
@@ -32,72 +250,49 @@ def get_recipe(recipe_id: int):
     * `number_of_favorites`: The number of users that have favorited the recipe.
 
     """
-    with db.engine.connect() as conn:
-        recipe_stmt = (
-        sqlalchemy.select(
-            db.recipes.c.recipe_id,
-            db.recipes.c.recipe_name,
-            db.recipes.c.prep_time_mins,
-            db.recipes.c.recipe_instructions,
-            db.recipes.c.number_of_favorites,
-            sqlalchemy.func.ARRAY_AGG(sqlalchemy.distinct(db.meal_type.c.meal_type)).label("meal_types"),
-            sqlalchemy.func.ARRAY_AGG(sqlalchemy.distinct(db.cuisine_type.c.cuisine_type)).label("cuisine_types"),
-            sqlalchemy.func.ARRAY_AGG(sqlalchemy.distinct(db.ingredients.c.ingredient_name)).label("ingredients"),
-        )
-        .select_from(
-            db.recipes
-            .outerjoin(
-                db.recipe_meal_types,
-                db.recipes.c.recipe_id == db.recipe_meal_types.c.recipe_id
-            )
-            .outerjoin(
-                db.recipe_cuisine_types,
-                db.recipes.c.recipe_id == db.recipe_cuisine_types.c.recipe_id
-            )
-            .outerjoin(
-                db.meal_type,
-                db.meal_type.c.meal_type_id == db.recipe_meal_types.c.meal_type_id
-            )
-            .outerjoin(
-                db.cuisine_type,
-                db.cuisine_type.c.cuisine_type_id == db.recipe_cuisine_types.c.cuisine_type_id
-            )
-            .outerjoin(
-                db.ingredient_quantities,
-                db.recipes.c.recipe_id == db.ingredient_quantities.c.recipe_id
-            )
-            .outerjoin(
-                db.ingredients,
-                db.ingredients.c.ingredient_id == db.ingredient_quantities.c.ingredient_id
-            )
-        )
-        .where(db.recipes.c.recipe_id == recipe_id)
-        .group_by(
-            db.recipes.c.recipe_id,
-            db.recipes.c.recipe_name,
-            db.recipes.c.prep_time_mins,
-            db.recipes.c.recipe_instructions,
-            db.recipes.c.number_of_favorites
-        )
-        )
-        result = conn.execute(recipe_stmt)
-        row = result.fetchone()
-
-        if row is None:
-            raise HTTPException(status_code=404, detail="Recipe not found.")
-
-        json = {
-            "recipe_id": row.recipe_id,
-            "recipe_name": row.recipe_name,
-            "cuisine_type": row.cuisine_types,
-            "meal_type": row.meal_types,
-            "prep_time_mins": row.prep_time_mins,
-            "instructions": row.recipe_instructions,
-            "ingredients": row.ingredients,
-            "number_of_favorites": row.number_of_favorites,
-        }
+    document = recipe_cache.get(recipe_id)
+    if document is not None:
+        return document
 
-    return json
+    generation = recipe_cache.generation(recipe_id)
+    document = await db.run(_get_recipe_document, recipe_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Recipe not found.")
+
+    recipe_cache.set(recipe_id, document, generation)
+    return document
+
+
+@router.get("/recipes/{recipe_id}/similar-by-favorites", tags=["recipes"])
+async def get_similar_by_favorites(recipe_id: int, limit: int = Query(10, ge=1, le=50)):
+    """
+    This endpoint returns the recipes most often favorited by the users who
+    favorited this recipe ("users who favorited this also favorited"). For
+    each recipe it returns:
+    * `recipe_id`: the internal id of the recipe.
+    * `recipe_name`: The name of the recipe.
+    * `shared_favorites`: The number of users who favorited both recipes.
+
+    Up to `limit` recipes are returned, most shared first. They are computed
+    in memory from all favorites and follow new favorites as they are made.
+    """
+    await similar_by_favorites.ensure_fresh()
+    similar = similar_by_favorites.similar(recipe_id, limit)
+
+    def fetch_names(conn):
+        ids = [recipe_id] + [other for other, _ in similar]
+        return dict(conn.execute(
+            sqlalchemy.select(db.recipes.c.recipe_id, db.recipes.c.recipe_name).where(db.recipes.c.recipe_id.in_(ids))
+        ).all())
+
+    names = await db.run(fetch_names)
+    if recipe_id not in names:
+        raise HTTPException(status_code=404, detail="Recipe not found.")
+    return {"recipe_id": recipe_id, "similar": [
+        {"recipe_id": other, "recipe_name": names[other], "shared_favorites": shared}
+        for other, shared in similar
+        if other in names
+    ]}
 
 
 
@@ -106,13 +301,31 @@ class recipe_sort_options(str, Enum):
     recipe = "recipe"
     time = "time"
     number_of_favorites = "number_of_favorites"
+    cost = "cost"
+    calories = "calories"
+
+
+# sort option -> (sort column, descending); every sort is tie-broken on recipe_id
+recipe_sort_keys = {
+    recipe_sort_options.recipe: (db.recipes.c.recipe_name, False),
+    recipe_sort_options.time: (db.recipes.c.prep_time_mins, False),
+    recipe_sort_options.number_of_favorites: (db.recipes.c.number_of_favorites, True),
+    recipe_sort_options.cost: (db.recipes.c.total_cost_usd, False),
+    recipe_sort_options.calories: (db.recipes.c.calories, False),
+}
 
 @router.get("/recipes/", tags=["recipes"])
-def list_recipe(recipe: str = "",
+async def list_recipe(recipe: str = "",
     cuisine: str = "",
     meal_type: str = "",
     limit: int = Query(50, ge=1, le=250),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    search: str = "",
+    min_similarity: float = Query(0.3, ge=0.0, le=1.0),
+    max_cost: Optional[float] = Query(None, ge=0),
+    min_calories: Optional[int] = Query(None, ge=0),
+    max_calories: Optional[int] = Query(None, ge=0),
     sort: recipe_sort_options = recipe_sort_options.recipe):
     """
     This endpoint returns a list of recipes. For each recipe it returns:
@@ -124,6 +337,8 @@ def list_recipe(recipe: str = "",
     * `time`: time needed to make the recipe.
     * `instructions`: instrustion to make the recipe.
     * `number_of_favorites`: number of users who have favorited recipe.
+    * `calories`: calories in one serving of the recipe.
+    * `total_cost_usd`: the summed price of the recipe's ingredients.
 
 
     You can filter for recipes whose name contains a string by using the
@@ -131,86 +346,168 @@ def list_recipe(recipe: str = "",
     `cuisine` query parameter. You can filter for recipes by meal-type by using the
     `type` query parameter. 
 
+    `max_cost` keeps recipes costing at most that much, and `min_calories`
+    and `max_calories` keep recipes within that calorie range. Recipes with
+    no known cost or calories are left out by the matching filter.
+
     You can also sort the results by using the `sort` query parameter:
     * `recipe` - Sort by recipe name alphabetically.
     * `time` - Sort by cooking time.
     * `number_of_favorites` - Sort by number of users who have favorited recipe.
+    * `cost` - Sort by total cost, cheapest first.
+    * `calories` - Sort by calories, lowest first.
 
 
     The `limit` and `offset` query parameters are used for pagination.
     The `limit` query parameter specifies the maximum number of results to return.
     The `offset` query parameter specifies the number of results to skip before
     returning results.
+
+    For deep pages use the `cursor` query parameter instead of `offset`. Pass an
+    empty `cursor` to get the first page; the response then includes a
+    `next_cursor` to pass as `cursor` for the following page (`null` on the
+    last page). A cursor is only valid for the `sort` it was issued with.
+
+    The `search` query parameter runs a typo tolerant search on recipe names.
+    Results are ranked by trigram similarity to the search string (returned as
+    `similarity`) instead of by `sort`, and recipes less similar than
+    `min_similarity` (0 to 1, default 0.3) are left out. Search results are
+    paged with `offset`.
     """
-    if sort is recipe_sort_options.recipe:
-        sort_by = db.recipes.c.recipe_name
-    elif sort is recipe_sort_options.time:
-        sort_by = db.recipes.c.prep_time_mins
-    elif sort is recipe_sort_options.number_of_favorites:
-        sort_by = db.recipes.c.number_of_favorites.desc()
-    else:
+    if sort not in recipe_sort_keys:
         raise HTTPException(status_code=400, detail="Invalid sort option")
+    sort_column, descending = recipe_sort_keys[sort]
+    if search != "" and cursor is not None:
+        raise HTTPException(status_code=400, detail="cursor cannot be combined with search")
+    if min_calories is not None and max_calories is not None and min_calories > max_calories:
+        raise HTTPException(status_code=400, detail="min_calories cannot be greater than max_calories")
 
-    stmt = (
-        sqlalchemy.select(
-            db.recipes.c.recipe_id,
-            db.recipes.c.recipe_name,
-            db.recipes.c.prep_time_mins,
-            db.recipes.c.recipe_instructions,
-            db.recipes.c.number_of_favorites,
-            sqlalchemy.func.ARRAY_AGG(sqlalchemy.distinct(db.meal_type.c.meal_type)).label("meal_types"),
-            sqlalchemy.func.ARRAY_AGG(sqlalchemy.distinct(db.cuisine_type.c.cuisine_type)).label("cuisine_types")
-        )
-        .select_from(
-            db.recipes
-            .outerjoin(
-                db.recipe_meal_types,
-                db.recipes.c.recipe_id == db.recipe_meal_types.c.recipe_id
-            )
-            .outerjoin(
-                db.recipe_cuisine_types,
-                db.recipes.c.recipe_id == db.recipe_cuisine_types.c.recipe_id
-            )
-            .outerjoin(
-                db.meal_type,
-                db.meal_type.c.meal_type_id == db.recipe_meal_types.c.meal_type_id
-            )
-            .outerjoin(
-                db.cuisine_type,
-                db.cuisine_type.c.cuisine_type_id == db.recipe_cuisine_types.c.cuisine_type_id
-            )
+    # the page of recipes is picked from `recipes` alone; cuisine and meal type
+    # filters are semi-joins on the bridge tables so they never fan out rows
+    page_stmt = sqlalchemy.select(
+        db.recipes.c.recipe_id,
+        db.recipes.c.recipe_name,
+        db.recipes.c.prep_time_mins,
+        db.recipes.c.recipe_instructions,
+        db.recipes.c.number_of_favorites,
+        db.recipes.c.calories,
+        db.recipes.c.total_cost_usd,
+    )
+
+    if search != "":
+        # `%` is pg_trgm's similarity operator; unlike a plain similarity()
+        # comparison it can use the trigram index on recipe_name
+        similarity = sqlalchemy.func.similarity(db.recipes.c.recipe_name, search).label("similarity")
+        page_stmt = (
+            page_stmt.add_columns(similarity)
+            .where(db.recipes.c.recipe_name.op("%")(search))
+            .order_by(similarity.desc(), db.recipes.c.recipe_id)
         )
-        .group_by(
-            db.recipes.c.recipe_id,
-            db.recipes.c.recipe_name,
-            db.recipes.c.prep_time_mins,
-            db.recipes.c.recipe_instructions,
-            db.recipes.c.number_of_favorites
-        ).order_by(sort_by).limit(limit).offset(offset).distinct()
-     )
+    else:
+        page_stmt = page_stmt.order_by(*pagination.order_by(sort_column, db.recipes.c.recipe_id, descending))
+
+    seek = None
+    if cursor is None:
+        page_stmt = page_stmt.limit(limit).offset(offset)
+    else:
+        if offset != 0:
+            raise HTTPException(status_code=400, detail="cursor and offset cannot be combined")
+        if cursor != "":
+            value_types = (str,) if isinstance(sort_column.type, sqlalchemy.String) else (int, float)
+            try:
+                seek = pagination.decode_cursor(cursor, sort.value, value_types)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        # fetch one extra row to know whether there is a next page
+        page_stmt = page_stmt.limit(limit + 1)
     
     if recipe != "":
-        stmt = stmt.where(db.recipes.c.recipe_name.ilike(f"%{recipe}%"))
+        page_stmt = page_stmt.where(db.recipes.c.recipe_name.ilike(f"%{recipe}%"))
+    # range filters on precomputed columns, each served by its sort index
+    if max_cost is not None:
+        page_stmt = page_stmt.where(db.recipes.c.total_cost_usd <= max_cost)
+    if min_calories is not None:
+        page_stmt = page_stmt.where(db.recipes.c.calories >= min_calories)
+    if max_calories is not None:
+        page_stmt = page_stmt.where(db.recipes.c.calories <= max_calories)
 
-    if cuisine != "":
-        stmt = stmt.where(db.cuisine_type.c.cuisine_type.ilike(f"%{cuisine}%"))
+    def fetch_page(conn):
+        stmt = page_stmt
 
-    if meal_type != "":
-        stmt = stmt.where(db.meal_type.c.meal_type.ilike(f"%{meal_type}%"))
+        # resolve the name filters to id sets against the in memory lookup tables
+        if cuisine != "":
+            cuisine_ids = registry.cuisine_type_ids_matching(cuisine, conn)
+            if len(cuisine_ids) == 0:
+                return []
+            stmt = stmt.where(
+                sqlalchemy.exists().where(
+                    db.recipe_cuisine_types.c.recipe_id == db.recipes.c.recipe_id,
+                    db.recipe_cuisine_types.c.cuisine_type_id.in_(cuisine_ids),
+                )
+            )
 
-    
+        if meal_type != "":
+            meal_type_ids = registry.meal_type_ids_matching(meal_type, conn)
+            if len(meal_type_ids) == 0:
+                return []
+            stmt = stmt.where(
+                sqlalchemy.exists().where(
+                    db.recipe_meal_types.c.recipe_id == db.recipes.c.recipe_id,
+                    db.recipe_meal_types.c.meal_type_id.in_(meal_type_ids),
+                )
+            )
+
+        def page_rows(stmt):
+            # aggregate cuisines and meal types only for the recipes on the page
+            page = stmt.subquery("page")
+            stmt = sqlalchemy.select(
+                page,
+                recipe_documents.name_list(db.meal_type.c.meal_type, db.meal_type, db.recipe_meal_types, "meal_type_id", page.c.recipe_id).label("meal_types"),
+                recipe_documents.name_list(db.cuisine_type.c.cuisine_type, db.cuisine_type, db.recipe_cuisine_types, "cuisine_type_id", page.c.recipe_id).label("cuisine_types"),
+            )
+            if search != "":
+                stmt = stmt.order_by(page.c.similarity.desc(), page.c.recipe_id)
+            else:
+                stmt = stmt.order_by(*pagination.order_by(page.c[sort_column.name], page.c.recipe_id, descending))
+            return conn.execute(stmt).fetchall()
 
-    with db.engine.connect() as conn:
-        result = conn.execute(stmt)
-        if result.rowcount == 0:
-            raise HTTPException(status_code=404, detail="no recipes found")
-        json = {}
-        json["recipes"] = []
-        for row in result:
-            json["recipes"].append({"recipe_id": row[0], "recipe_name": row[1], "cuisine": row[6],
-                                     "meal_type": row[5], "prep_time_mins": str(row[2]) + " minutes",
-                                       "instructions": row[3], "number_of_favorites": row[4]})
-        return json
+        if search != "":
+            # the `%` operator compares against this setting, scoped to the transaction
+            conn.execute(
+                sqlalchemy.text("SELECT set_config('pg_trgm.similarity_threshold', :threshold, true)"),
+                {"threshold": str(min_similarity)},
+            )
+        if seek is None:
+            return page_rows(stmt)
+
+        last_value, last_id = seek
+        rows = page_rows(stmt.where(pagination.seek_condition(sort_column, db.recipes.c.recipe_id, last_value, last_id, descending)))
+        if last_value is not None and len(rows) <= limit and sort_column.nullable:
+            # ran out of non NULL sort keys: the page continues into the NULL tail
+            null_tail = pagination.seek_condition(sort_column, db.recipes.c.recipe_id, None, 0, descending)
+            rows += page_rows(stmt.where(null_tail).limit(limit + 1 - len(rows)))
+        return rows
+
+    await registry.ensure_fresh()
+    rows = await db.run(fetch_page)
+    if len(rows) == 0:
+        raise HTTPException(status_code=404, detail="no recipes found")
+    json = {}
+    json["recipes"] = []
+    for row in rows[:limit]:
+        recipe_json = {"recipe_id": row.recipe_id, "recipe_name": row.recipe_name, "cuisine": row.cuisine_types,
+                                 "meal_type": row.meal_types, "prep_time_mins": str(row.prep_time_mins) + " minutes",
+                                   "instructions": row.recipe_instructions, "number_of_favorites": row.number_of_favorites,
+                                   "calories": row.calories, "total_cost_usd": row.total_cost_usd}
+        if search != "":
+            recipe_json["similarity"] = row.similarity
+        json["recipes"].append(recipe_json)
+    if cursor is not None:
+        json["next_cursor"] = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            json["next_cursor"] = pagination.encode_cursor(sort.value, last._mapping[sort_column.name], last.recipe_id)
+    return json
 
 
 
@@ -234,11 +531,110 @@ class recipeJson(BaseModel):
     ingredients: Optional[List[IngredientsJson]]
 
 
+def _missing_ids(conn, recipes):
+    """
+    Returns the cuisine, meal type and ingredient ids referenced by any of the
+    recipes that don't exist, with a single lookup per id type.
+    """
+    return {
+        "cuisine_type_id": set(registry.missing_cuisine_type_ids(
+            {i for recipe in recipes for i in recipe.cuisine_type_id or []}, conn)),
+        "meal_type_id": set(registry.missing_meal_type_ids(
+            {i for recipe in recipes for i in recipe.meal_type_id or []}, conn)),
+        "ingredient_id": set(registry.missing_ingredient_ids(
+            {ingredient.ingredient_id for recipe in recipes for ingredient in recipe.ingredients or []}, conn)),
+    }
+
+
+def _invalid_ids(recipe: recipeJson, missing):
+    """
+    Returns the ids in the recipe that don't exist (or are repeated) keyed by
+    field, or an empty dict if every id is valid. `missing` comes from
+    _missing_ids().
+    """
+    invalid = {}
+    for field, ids in (("cuisine_type_id", recipe.cuisine_type_id or []),
+                       ("meal_type_id", recipe.meal_type_id or []),
+                       ("ingredient_id", [ingredient.ingredient_id for ingredient in recipe.ingredients or []])):
+        bad = sorted(set(ids) & missing[field])
+        if bad:
+            invalid[field] = bad
+    ingredient_ids = [ingredient.ingredient_id for ingredient in recipe.ingredients or []]
+    repeated = sorted({i for i in ingredient_ids if ingredient_ids.count(i) > 1})
+    if repeated:
+        invalid["duplicate_ingredient_id"] = repeated
+    return invalid
+
+
+def _total_cost(recipe: recipeJson):
+    """
+    The recipe's total_cost_usd: the sum of its ingredient prices, None when
+    none has a price, like SUM over its ingredient_quantities rows.
+    """
+    prices = [ingredient.ingredient_price_usd for ingredient in recipe.ingredients or []
+              if ingredient.ingredient_price_usd is not None]
+    return sum(prices) if prices else None
+
+
+def _unnest_insert(table, rows):
+    """
+    INSERT ... SELECT from unnest() with one array parameter per column,
+    rather than a multi-row VALUES with one per value: the statement is the
+    same whatever the number of rows, so SQLAlchemy compiles it once, and a
+    batch can't run into asyncpg's 32767 query argument limit.
+    """
+    columns = list(rows[0])
+    arrays = []
+    for column in columns:
+        column_type = table.c[column].type
+        # casting to varchar(n) would silently truncate longer values, where
+        # inserting them into the column fails
+        if isinstance(column_type, String):
+            column_type = String()
+        array_type = ARRAY(column_type)
+        # the explicit cast tells asyncpg the array's type, which unnest() can't
+        arrays.append(sqlalchemy.cast(sqlalchemy.literal([row[column] for row in rows], array_type), array_type))
+    source = func.unnest(*arrays).table_valued(*columns).render_derived()
+    return sqlalchemy.insert(table).from_select(columns, select(*source.c))
+
+
+def _insert_recipe_details(conn, recipes):
+    """
+    Writes the cuisine, meal type and ingredient rows of already inserted
+    recipes, given as (recipe_id, recipeJson) pairs, with one INSERT per
+    bridge table.
+    """
+    cuisine_rows = [
+        {"recipe_id": recipe_id, "cuisine_type_id": cuisine_type_id}
+        for recipe_id, recipe in recipes
+        for cuisine_type_id in dict.fromkeys(recipe.cuisine_type_id or [])
+    ]
+    meal_type_rows = [
+        {"recipe_id": recipe_id, "meal_type_id": meal_type_id}
+        for recipe_id, recipe in recipes
+        for meal_type_id in dict.fromkeys(recipe.meal_type_id or [])
+    ]
+    # amount is a varchar column; asyncpg, unlike psycopg2, won't bind an int to it
+    ingredient_rows = [
+        {"recipe_id": recipe_id, "ingredient_id": ingredient.ingredient_id, "unit_type": ingredient.unit_type,
+         "amount": None if ingredient.amount is None else str(ingredient.amount),
+         "ingredient_price_usd": ingredient.ingredient_price_usd}
+        for recipe_id, recipe in recipes
+        for ingredient in recipe.ingredients or []
+    ]
+    if cuisine_rows:
+        conn.execute(_unnest_insert(db.recipe_cuisine_types, cuisine_rows))
+    if meal_type_rows:
+        conn.execute(_unnest_insert(db.recipe_meal_types, meal_type_rows))
+    if ingredient_rows:
+        conn.execute(_unnest_insert(db.ingredient_quantities, ingredient_rows))
+
+
 # all parameters are optional except the recipe name
 # all parameters are passed in from the request body now
-# complex transaction function since it uses commit(), rollback(), implements data validation, performs multiple database operations
+# complex transaction function since it implements data validation and performs multiple database operations
 @router.post("/recipes/", tags=["recipes"])
-def add_recipe(recipe: recipeJson):
+async def add_recipe(recipe: recipeJson):
     """
     This endpoint will allow users to add their own recipes to the API.
     To add a recipe, the user must provide:
@@ -251,51 +647,167 @@ def add_recipe(recipe: recipeJson):
     * `url`: The url to the recipe.
     * `ingredients`: The list that contains the ingredients and amounts
       that are needed to make the recipe.
+
+    If any id is invalid the recipe is not added, and the 400 response lists
+    every invalid id by field.
     """
+    await registry.ensure_fresh()
+    recipe_id = await db.run(_add_recipe, recipe)
+    recipe_cache.invalidate(recipe_id)
+    cookable_recipes.set_recipe(recipe_id, [ingredient.ingredient_id for ingredient in recipe.ingredients or []])
+    return {"recipe_id": recipe_id}
+
+
+def _add_recipe(conn, recipe: recipeJson):
+    # validate every referenced id before writing anything
+    invalid = _invalid_ids(recipe, _missing_ids(conn, [recipe]))
+    if invalid:
+        raise HTTPException(status_code=400, detail={"message": "invalid ids", **invalid})
+
     check_valid_recipe_stmt = sqlalchemy.select(db.recipes.c.recipe_id).where(db.recipes.c.recipe_name == recipe.recipe)
-    with db.engine.begin() as conn:
-        result = conn.execute(check_valid_recipe_stmt)
-        if result.rowcount != 0:
-            raise HTTPException(status_code=409, detail="recipe already exists")
-        stmt = sqlalchemy.insert(db.recipes).values(recipe_name=recipe.recipe, calories=recipe.calories,
-                                                    prep_time_mins=recipe.time, recipe_instructions=recipe.recipe_instructions,
-                                                    recipe_url=recipe.url, number_of_favorites=0)
-        result = conn.execute(stmt)
-        recipe_id = result.inserted_primary_key[0]
-        print(recipe.cuisine_type_id, recipe.meal_type_id)
-        if recipe.cuisine_type_id is not None:
-            for cuisine_type in recipe.cuisine_type_id:
-                check_valid_cuisine_stmt = sqlalchemy.select(db.cuisine_type.c.cuisine_type).where(db.cuisine_type.c.cuisine_type_id == cuisine_type)
-                check_valid_result = conn.execute(check_valid_cuisine_stmt)
-                if check_valid_result.rowcount == 0:
-                    conn.rollback()
-                    raise HTTPException(status_code=400, detail="invalid cuisine id")
-                stmt = sqlalchemy.insert(db.recipe_cuisine_types).values(recipe_id=recipe_id, cuisine_type_id=cuisine_type)
-                conn.execute(stmt)
-        if recipe.meal_type_id is not None:
-            for meal_type in recipe.meal_type_id:
-                check_valid_meal_type_stmt = sqlalchemy.select(db.meal_type.c.meal_type).where(db.meal_type.c.meal_type_id == meal_type)
-                check_valid_result = conn.execute(check_valid_meal_type_stmt)
-                if check_valid_result.rowcount == 0:
-                    conn.rollback()
-                    raise HTTPException(status_code=400, detail="invalid meal type id")
-                stmt = sqlalchemy.insert(db.recipe_meal_types).values(recipe_id=recipe_id, meal_type_id=meal_type)
-                conn.execute(stmt)
-        if recipe.ingredients is not None:
-            for ingredient in recipe.ingredients:
-                check_valid_ingredient_stmt = sqlalchemy.select(db.ingredients.c.ingredient_name).where(db.ingredients.c.ingredient_id == ingredient.ingredient_id)
-                check_valid_result = conn.execute(check_valid_ingredient_stmt)
-                if check_valid_result.rowcount == 0:
-                    conn.rollback()
-                    raise HTTPException(status_code=400, detail="invalid ingredient id")
-                stmt = sqlalchemy.insert(db.ingredient_quantities).values(recipe_id=recipe_id, ingredient_id= ingredient.ingredient_id,
-                                                                            unit_type=ingredient.unit_type, amount=ingredient.amount, ingredient_price_usd=ingredient.ingredient_price_usd)
-                conn.execute(stmt)
-            
-        return {"recipe_id": recipe_id}
+    result = conn.execute(check_valid_recipe_stmt)
+    if result.first() is not None:
+        raise HTTPException(status_code=409, detail="recipe already exists")
+    stmt = sqlalchemy.insert(db.recipes).values(recipe_name=recipe.recipe, calories=recipe.calories,
+                                                prep_time_mins=recipe.time, recipe_instructions=recipe.recipe_instructions,
+                                                recipe_url=recipe.url, number_of_favorites=0,
+                                                total_cost_usd=_total_cost(recipe)).returning(db.recipes.c.recipe_id)
+    recipe_id = conn.execute(stmt).scalar_one()
+    _insert_recipe_details(conn, [(recipe_id, recipe)])
+    recipe_documents.refresh(conn, [recipe_id])
+    return recipe_id
+
+def _import_batch(conn, lines, added=None):
+    """
+    Parses, validates and inserts one batch of (line_number, raw json line)
+    pairs in a single transaction. Returns one result per line, and appends
+    a (recipe_id, recipeJson) pair for each added recipe to `added`.
+    """
+    results = {}
+    recipes = []
+    for line_number, line in lines:
+        try:
+            recipes.append((line_number, recipeJson.parse_raw(line)))
+        except ValidationError as e:
+            results[line_number] = {"line": line_number, "error": e.errors()}
+
+    missing = _missing_ids(conn, [recipe for _, recipe in recipes])
+    valid = {}
+    for line_number, recipe in recipes:
+        invalid = _invalid_ids(recipe, missing)
+        if invalid:
+            results[line_number] = {"line": line_number, "error": {"message": "invalid ids", **invalid}}
+        elif recipe.recipe in valid:
+            results[line_number] = {"line": line_number, "error": "duplicate recipe in batch"}
+        else:
+            valid[recipe.recipe] = (line_number, recipe)
+
+    if valid:
+        try:
+            # a savepoint, so a failed insert keeps the per line errors above
+            with conn.begin_nested():
+                existing = conn.execute(
+                    sqlalchemy.select(db.recipes.c.recipe_name).where(db.recipes.c.recipe_name.in_(list(valid)))
+                ).scalars().all()
+                for name in existing:
+                    line_number, _ = valid.pop(name)
+                    results[line_number] = {"line": line_number, "error": "recipe already exists"}
+
+                if valid:
+                    inserted = conn.execute(
+                        _unnest_insert(db.recipes, [
+                            {"recipe_name": recipe.recipe, "calories": recipe.calories, "prep_time_mins": recipe.time,
+                             "recipe_instructions": recipe.recipe_instructions, "recipe_url": recipe.url,
+                             "number_of_favorites": 0, "total_cost_usd": _total_cost(recipe)}
+                            for _, recipe in valid.values()
+                        ]).returning(db.recipes.c.recipe_id, db.recipes.c.recipe_name)
+                    ).all()
+                    # names are unique within the batch, so they key the returned ids
+                    recipe_ids = {row.recipe_name: row.recipe_id for row in inserted}
+                    _insert_recipe_details(conn, [(recipe_ids[name], recipe) for name, (_, recipe) in valid.items()])
+                    recipe_documents.refresh(conn, recipe_ids.values())
+                    for name, (line_number, _) in valid.items():
+                        results[line_number] = {"line": line_number, "recipe_id": recipe_ids[name]}
+                    if added is not None:
+                        added.extend((recipe_ids[name], recipe) for name, (_, recipe) in valid.items())
+        except sqlalchemy.exc.DBAPIError as e:
+            for line_number, _ in valid.values():
+                results[line_number] = {"line": line_number, "error": f"batch failed: {e.orig}"}
+
+    return [results[line_number] for line_number, _ in lines]
+
+
+def _index_added(added):
+    # only once the batch has committed, then start the next batch afresh
+    for recipe_id, recipe in added:
+        cookable_recipes.set_recipe(recipe_id, [ingredient.ingredient_id for ingredient in recipe.ingredients or []])
+    added.clear()
+
+
+async def _bulk_import(request: Request, batch_size: int):
+    """
+    Reads the NDJSON body as it arrives and yields one NDJSON result line per
+    input line, a batch at a time, so neither the payload nor the results are
+    held in memory.
+    """
+    await registry.ensure_fresh()
+    pending = b""
+    line_number = 0
+    batch = []
+    added = []
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                batch.append((line_number, line))
+            if len(batch) >= batch_size:
+                for result in await db.run(_import_batch, batch, added):
+                    yield json.dumps(result, default=str) + "\n"
+                _index_added(added)
+                batch = []
+    if pending.strip():
+        batch.append((line_number + 1, pending))
+    if batch:
+        for result in await db.run(_import_batch, batch, added):
+            yield json.dumps(result, default=str) + "\n"
+        _index_added(added)
+
+
+class _RequestStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse for a body generated while the request body is still
+    being read. Starlette's version listens for the client disconnecting
+    while it streams, and that listener would swallow the request body
+    messages the generator is waiting on; request.stream() reports a
+    disconnect itself.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+@router.post("/recipes/bulk", tags=["recipes"])
+async def bulk_add_recipes(request: Request, batch_size: int = Query(1000, ge=1, le=10000)):
+    """
+    This endpoint adds many recipes at once. The request body is NDJSON: one
+    recipe per line, in the same format as the `/recipes/` POST endpoint.
+    Lines are imported in batches of `batch_size`, each batch in its own
+    transaction, so a bad line only fails itself and a database error only
+    fails its batch.
+
+    The response is NDJSON with one result per non empty input line, in
+    order: `{"line": n, "recipe_id": id}` for added recipes or
+    `{"line": n, "error": ...}` otherwise.
+    """
+    return _RequestStreamingResponse(_bulk_import(request, batch_size), media_type="application/x-ndjson")
+
 
 @router.put("/recipes/{recipe_id}/", tags=["recipes"])
-def modify_recipe(
+async def modify_recipe(
     recipe_id: int,
     old_ingredient_id: int,
     new_ingredient_id: int,
@@ -312,20 +824,18 @@ def modify_recipe(
     * `new_ingredient_id`: The id of the new ingredient.
     * `new_unit_type`: The new unit type the ingredient is measured in.
     * `new_amount`: The new amount of ingredient needed.
-    * `new_ingredient_cost`: The new ingredient cost.
+    * `new_ingredient_cost`: The new ingredient cost. The recipe's
+      `total_cost_usd` is recomputed to match.
     """
     check_valid_recipe_stmt = sqlalchemy.select(db.recipes.c.recipe_id).where(db.recipes.c.recipe_id == recipe_id)
     check_valid_ingredient_stmt = sqlalchemy.select(db.ingredients.c.ingredient_id).where(db.ingredients.c.ingredient_id == new_ingredient_id)
     check_ingredient_in_recipe_stmt = sqlalchemy.select(db.ingredient_quantities.c.ingredient_id).where(db.ingredient_quantities.c.recipe_id == recipe_id).where(db.ingredient_quantities.c.ingredient_id == old_ingredient_id)
-    with db.engine.begin() as conn:
-        result = conn.execute(check_valid_recipe_stmt)
-        if result.rowcount == 0:
+    def modify(conn):
+        if conn.execute(check_valid_recipe_stmt).first() is None:
             raise HTTPException(status_code=404, detail="recipe does not exist")
-        result = conn.execute(check_valid_ingredient_stmt)
-        if result.rowcount == 0:
+        if conn.execute(check_valid_ingredient_stmt).first() is None:
             raise HTTPException(status_code=404, detail="new ingredient does not exist, you can add it using the POST /ingredients/ endpoint")
-        result = conn.execute(check_ingredient_in_recipe_stmt)
-        if result.rowcount == 0:
+        if conn.execute(check_ingredient_in_recipe_stmt).first() is None:
             raise HTTPException(status_code=404, detail="ingredient does not exist in recipe")
         stmt = sqlalchemy.update(db.ingredient_quantities).where(db.ingredient_quantities.c.recipe_id == recipe_id).where(db.ingredient_quantities.c.ingredient_id == old_ingredient_id).values(ingredient_id=new_ingredient_id)
         conn.execute(stmt)
@@ -338,102 +848,198 @@ def modify_recipe(
         if new_ingredient_cost is not None:
             stmt = sqlalchemy.update(db.ingredient_quantities).where(db.ingredient_quantities.c.recipe_id == recipe_id).where(db.ingredient_quantities.c.ingredient_id == new_ingredient_id).values(ingredient_price_usd=new_ingredient_cost)
             conn.execute(stmt)
-        return {"recipe_id": recipe_id}
+            total_cost = (
+                sqlalchemy.select(sqlalchemy.func.sum(db.ingredient_quantities.c.ingredient_price_usd))
+                .where(db.ingredient_quantities.c.recipe_id == recipe_id)
+                .scalar_subquery()
+            )
+            conn.execute(sqlalchemy.update(db.recipes).where(db.recipes.c.recipe_id == recipe_id).values(total_cost_usd=total_cost))
+        recipe_documents.refresh(conn, [recipe_id])
+        return conn.execute(
+            sqlalchemy.select(db.ingredient_quantities.c.ingredient_id).where(db.ingredient_quantities.c.recipe_id == recipe_id)
+        ).scalars().all()
+
+    ingredient_ids = await db.run(modify)
+    recipe_cache.invalidate(recipe_id)
+    cookable_recipes.set_recipe(recipe_id, ingredient_ids)
+    return {"recipe_id": recipe_id}
 
 
 #add username to parameters
 @router.put("/favorited_recipes/", tags=["favorited_recipes"])
-def favorite_recipe(user_id: int, recipe_id: int
+async def favorite_recipe(user_id: int, recipe_id: int
     ):
     """
     This endpoint will allow users to add existing recipes to their favorites list. 
     The user must provide their username to favorite a recipe.
     """
-    #check user exists
-    find_user_stmt = sqlalchemy.select(db.users.c.user_id).where(db.users.c.user_id == user_id)
-    
-   
-    find_recipe_stmt = sqlalchemy.select(db.recipes.c.recipe_id).where(db.recipes.c.recipe_id == recipe_id)
-
-    with db.engine.connect() as conn:
-        transaction = conn.begin()
-
-        find_user_result = conn.execute(find_user_stmt)
-        if find_user_result.rowcount == 0:
-            raise HTTPException(status_code=404, detail="User not found.")
-        find_recipe_result = conn.execute(find_recipe_stmt)
-        if find_recipe_result.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Recipe not found.")
-        
-        try:
-            conn.execute(
-                    sqlalchemy.insert(db.favorited_recipes),
-                    [
-                        {"recipe_id": recipe_id,
-                        "user_id": user_id,
-                        "date_favorited": str(datetime.datetime.now())}
-                    ]
-                )
-                #exception will occur here if the recipe is already in the favorites list
-            transaction.commit()
-            #updates the number of favorites for the recipe if it is not already in the favorited by the user
-            update_num_favs_stmt = sqlalchemy.update(db.recipes).where(db.recipes.c.recipe_id == recipe_id).values(number_of_favorites = db.recipes.c.number_of_favorites + 1)
-            conn.execute(update_num_favs_stmt)
-            conn.commit()
-        #if the recipe is already in the favorites list, updates the date_favorited
-        except sqlalchemy.exc.IntegrityError: 
-            transaction.rollback()
-            update_favorite_stmt = sqlalchemy.update(db.favorited_recipes).where(db.favorited_recipes.c.recipe_id == recipe_id and db.favorited_recipes.c.user_id == user_id).values(date_favorited = str(datetime.datetime.now()))
-            conn.execute(update_favorite_stmt)
+    #one statement: insert the favorite or, if it already exists, update its
+    #date_favorited; only a fresh insert (xmax = 0) is counted
+    favorite_stmt = insert(db.favorited_recipes).values(
+        recipe_id=recipe_id, user_id=user_id, date_favorited=sqlalchemy.func.now()
+    )
+    favorite_stmt = favorite_stmt.on_conflict_do_update(
+        index_elements=[db.favorited_recipes.c.user_id, db.favorited_recipes.c.recipe_id],
+        set_={"date_favorited": favorite_stmt.excluded.date_favorited},
+    ).returning(db.favorited_recipes.c.recipe_id, sqlalchemy.literal_column("(xmax = 0)").label("inserted"))
+    favorited = favorite_stmt.cte("favorited")
+    counted = favorite_counts.record_from(
+        sqlalchemy.select(favorited.c.recipe_id).where(favorited.c.inserted), 1
+    ).cte("counted")
+    stmt = sqlalchemy.select(favorited.c.inserted).add_cte(counted)
 
+    try:
+        inserted = await db.run(lambda conn: conn.execute(stmt).scalar_one())
+    except sqlalchemy.exc.IntegrityError as e:
+        #unknown users and recipes fail the foreign keys
+        raise _favorite_not_found(e)
+    if inserted:
+        similar_by_favorites.record(user_id, [recipe_id], True)
     return {"recipe_id": recipe_id,
             "user_id": user_id} 
 
+
+def _favorite_not_found(e):
+    message = str(e.orig)
+    if "favorited_recipes_user_id_fkey" in message:
+        return HTTPException(status_code=404, detail="User not found.")
+    if "favorited_recipes_recipe_id_fkey" in message:
+        return HTTPException(status_code=404, detail="Recipe not found.")
+    return e
+
+
 @router.delete("/favorited_recipes/", tags=["favorited_recipes"])
-def unfavorite_recipe(user_id: str, recipe_id: int
+async def unfavorite_recipe(user_id: int, recipe_id: int
     ):
     """
     This endpoint will allow users to remove existing recipes from their favorites list. 
    
     """
-    find_user_stmt = sqlalchemy.select(db.users.c.user_id).where(db.users.c.user_id == user_id)
+    #one statement: delete the favorite, count the removal if there was one,
+    #and report whether the user and recipe exist
+    removed = (
+        sqlalchemy.delete(db.favorited_recipes)
+        .where(db.favorited_recipes.c.recipe_id == recipe_id)
+        .where(db.favorited_recipes.c.user_id == user_id)
+        .returning(db.favorited_recipes.c.recipe_id)
+        .cte("removed")
+    )
+    counted = favorite_counts.record_from(sqlalchemy.select(removed.c.recipe_id), -1).cte("counted")
+    stmt = sqlalchemy.select(
+        sqlalchemy.exists().where(db.users.c.user_id == user_id).label("user_exists"),
+        sqlalchemy.exists().where(db.recipes.c.recipe_id == recipe_id).label("recipe_exists"),
+    ).add_cte(counted)
+
+    result = await db.run(lambda conn: conn.execute(stmt).one())
+    if not result.user_exists:
+        raise HTTPException(status_code=404, detail="User not found.")
+    if not result.recipe_exists:
+        raise HTTPException(status_code=404, detail="Recipe not found.")
+    #a no-op if the recipe was not favorited
+    similar_by_favorites.record(user_id, [recipe_id], False)
+    return {"recipe_id": recipe_id,
+            "user_id": user_id} 
+
+class FavoritesJson(BaseModel):
+    recipe_ids: conlist(int, min_items=1, max_items=5000)
+
+
+def _requested_ids(recipe_ids):
+    # the distinct requested ids as one array parameter, however many there
+    # are; cast, as unnest() can't infer the array type from the bare parameter
+    ids_param = sqlalchemy.cast(sorted(set(recipe_ids)), ARRAY(sqlalchemy.Integer))
+    return sqlalchemy.select(sqlalchemy.func.unnest(ids_param).label("recipe_id")).cte("requested")
+
+
+@router.put("/favorited_recipes/bulk", tags=["favorited_recipes"])
+async def bulk_favorite_recipes(user_id: int, favorites: FavoritesJson):
+    """
+    This endpoint adds up to 5000 recipes to a user's favorites list in one
+    request, for example to sync favorites made offline. The body is
+    `{"recipe_ids": [...]}`.
 
-    find_recipe_stmt = sqlalchemy.select(db.recipes.c.recipe_id).where(db.recipes.c.recipe_id == recipe_id)
+    Returns a status per requested recipe id: `favorited`, `already favorited`
+    (its date_favorited is refreshed) or `recipe not found`.
+    """
+    requested = _requested_ids(favorites.recipe_ids)
+    favorite_stmt = insert(db.favorited_recipes).from_select(
+        ["recipe_id", "user_id", "date_favorited"],
+        sqlalchemy.select(
+            db.recipes.c.recipe_id,
+            sqlalchemy.literal(user_id, sqlalchemy.Integer),
+            sqlalchemy.func.now(),
+        ).join(requested, requested.c.recipe_id == db.recipes.c.recipe_id),
+    )
+    favorite_stmt = favorite_stmt.on_conflict_do_update(
+        index_elements=[db.favorited_recipes.c.user_id, db.favorited_recipes.c.recipe_id],
+        set_={"date_favorited": favorite_stmt.excluded.date_favorited},
+    ).returning(db.favorited_recipes.c.recipe_id, sqlalchemy.literal_column("(xmax = 0)").label("inserted"))
+    favorited = favorite_stmt.cte("favorited")
+    #one delta per newly favorited recipe
+    counted = favorite_counts.record_from(
+        sqlalchemy.select(favorited.c.recipe_id).where(favorited.c.inserted), 1
+    ).cte("counted")
+    stmt = sqlalchemy.select(favorited.c.recipe_id, favorited.c.inserted).add_cte(counted)
 
-    delete_favorite_stmt = sqlalchemy.delete(db.favorited_recipes).where(db.favorited_recipes.c.recipe_id == recipe_id and db.favorited_recipes.c.user_id == user_id)
+    try:
+        rows = await db.run(lambda conn: conn.execute(stmt).all())
+    except sqlalchemy.exc.IntegrityError as e:
+        raise _favorite_not_found(e)
+    inserted = dict(rows)
+    similar_by_favorites.record(user_id, [recipe_id for recipe_id, new in rows if new], True)
 
-    check_if_favorited_stmt = sqlalchemy.select(db.favorited_recipes.c.recipe_id).where(db.favorited_recipes.c.recipe_id == recipe_id and db.favorited_recipes.c.user_id == user_id)
+    results = []
+    for recipe_id in favorites.recipe_ids:
+        if recipe_id not in inserted:
+            status = "recipe not found"
+        elif inserted[recipe_id]:
+            status = "favorited"
+        else:
+            status = "already favorited"
+        results.append({"recipe_id": recipe_id, "status": status})
+    return {"user_id": user_id, "results": results}
 
-    decrement_num_favs_stmt = sqlalchemy.update(db.recipes).where(db.recipes.c.recipe_id == recipe_id).values(number_of_favorites = db.recipes.c.number_of_favorites - 1)
 
-    with db.engine.connect() as conn:
-        transaction = conn.begin()
-        find_user_result = conn.execute(find_user_stmt)
-        if find_user_result.rowcount == 0:
-            raise HTTPException(status_code=404, detail="User not found.")
-        find_recipe_result = conn.execute(find_recipe_stmt)
-        if find_recipe_result.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Recipe not found.")
-        check_if_favorited_result = conn.execute(check_if_favorited_stmt)
-        if check_if_favorited_result.rowcount == 0:
-            return {"recipe_id": recipe_id,
-                    "user_id": user_id} 
-        
-        try:
-            conn.execute(delete_favorite_stmt)
-            transaction.commit()
-            conn.execute(decrement_num_favs_stmt)
-            conn.commit()
-        except sqlalchemy.exc.IntegrityError:
-            transaction.rollback()
-    
-    return {"recipe_id": recipe_id,
-            "user_id": user_id} 
+@router.delete("/favorited_recipes/bulk", tags=["favorited_recipes"])
+async def bulk_unfavorite_recipes(user_id: int, favorites: FavoritesJson):
+    """
+    This endpoint removes up to 5000 recipes from a user's favorites list in
+    one request. The body is `{"recipe_ids": [...]}`.
+
+    Returns a status per requested recipe id: `unfavorited` or `not favorited`.
+    """
+    requested = _requested_ids(favorites.recipe_ids)
+    removed = (
+        sqlalchemy.delete(db.favorited_recipes)
+        .where(db.favorited_recipes.c.user_id == user_id)
+        .where(db.favorited_recipes.c.recipe_id.in_(sqlalchemy.select(requested.c.recipe_id)))
+        .returning(db.favorited_recipes.c.recipe_id)
+        .cte("removed")
+    )
+    counted = favorite_counts.record_from(sqlalchemy.select(removed.c.recipe_id), -1).cte("counted")
+    stmt = sqlalchemy.select(
+        sqlalchemy.exists().where(db.users.c.user_id == user_id).label("user_exists"),
+        sqlalchemy.select(sqlalchemy.func.array_agg(removed.c.recipe_id)).scalar_subquery().label("removed"),
+    ).add_cte(counted)
+
+    result = await db.run(lambda conn: conn.execute(stmt).one())
+    if not result.user_exists:
+        raise HTTPException(status_code=404, detail="User not found.")
+    removed_ids = set(result.removed or [])
+    similar_by_favorites.record(user_id, sorted(removed_ids), False)
+
+    results = [
+        {"recipe_id": recipe_id, "status": "unfavorited" if recipe_id in removed_ids else "not favorited"}
+        for recipe_id in favorites.recipe_ids
+    ]
+    return {"user_id": user_id, "results": results}
+
 
 @router.get("/favorited_recipes/", tags=["favorited_recipes"])
-def list_favorite_recipes(user_id: int, 
+async def list_favorite_recipes(user_id: int, 
     limit: int = Query(50, ge=1, le=250),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
     ):
     """
     This endpoint will list all recipes in the users favorites list. For each recipe it returns:
@@ -450,6 +1056,10 @@ def list_favorite_recipes(user_id: int,
     The `limit` and `offset` query parameters are used for pagination.
     The `limit` query parameter specifies the maximum number of results to return.
     The `offset` query parameter specifies the number of results to skip before
+    returning results.
+
+    As with `/recipes/`, pass an empty `cursor` instead of `offset` to page with
+    `next_cursor` tokens.
     """
     
 
@@ -459,6 +1069,7 @@ def list_favorite_recipes(user_id: int,
             db.recipes.c.recipe_name,
             db.recipes.c.prep_time_mins,
             db.recipes.c.recipe_instructions,
+            db.recipes.c.number_of_favorites,
             sqlalchemy.func.ARRAY_AGG(sqlalchemy.distinct(db.meal_type.c.meal_type)).label("meal_types"),
             sqlalchemy.func.ARRAY_AGG(sqlalchemy.distinct(db.cuisine_type.c.cuisine_type)).label("cuisine_types"),
             sqlalchemy.func.ARRAY_AGG(sqlalchemy.distinct(db.ingredients.c.ingredient_name)).label("ingredients"),
@@ -499,19 +1110,36 @@ def list_favorite_recipes(user_id: int,
             db.recipes.c.recipe_id,
             db.recipes.c.recipe_name,
             db.recipes.c.prep_time_mins,
-            db.recipes.c.recipe_instructions        ).order_by(db.recipes.c.recipe_name).limit(limit).offset(offset).distinct()
+            db.recipes.c.recipe_instructions,
+            db.recipes.c.number_of_favorites
+        ).order_by(*pagination.order_by(db.recipes.c.recipe_name, db.recipes.c.recipe_id)).distinct()
         )
 
-    with db.engine.connect() as conn:
-        favorited_results = conn.execute(recipe_stmt)
-        if favorited_results.rowcount == 0:
-            raise HTTPException(status_code=404, detail="no recipes favorited")
-        json = {}
-        json["recipes"] = []
-        for row in favorited_results:
-            json["recipes"].append({"recipe_id": row[0], "recipe_name": row[1], "cuisine": row[6],
-                                     "meal_type": row[5], "prep_time_mins": str(row[2]) + " minutes",
-                                       "instructions": row[3], "number_of_favorites": row[4]})
-        return json
-
+    if cursor is None:
+        recipe_stmt = recipe_stmt.limit(limit).offset(offset)
+    else:
+        if offset != 0:
+            raise HTTPException(status_code=400, detail="cursor and offset cannot be combined")
+        if cursor != "":
+            try:
+                last_name, last_id = pagination.decode_cursor(cursor, "favorites", (str,))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            recipe_stmt = recipe_stmt.where(pagination.seek_condition(db.recipes.c.recipe_name, db.recipes.c.recipe_id, last_name, last_id))
+        recipe_stmt = recipe_stmt.limit(limit + 1)
 
+    favorited_results = await db.run(lambda conn: conn.execute(recipe_stmt).fetchall())
+    if len(favorited_results) == 0:
+        raise HTTPException(status_code=404, detail="no recipes favorited")
+    json = {}
+    json["recipes"] = []
+    for row in favorited_results[:limit]:
+        json["recipes"].append({"recipe_id": row.recipe_id, "recipe_name": row.recipe_name, "cuisine": row.cuisine_types,
+                                 "meal_type": row.meal_types, "prep_time_mins": str(row.prep_time_mins) + " minutes",
+                                   "instructions": row.recipe_instructions, "number_of_favorites": row.number_of_favorites})
+    if cursor is not None:
+        json["next_cursor"] = None
+        if len(favorited_results) > limit:
+            last = favorited_results[limit - 1]
+            json["next_cursor"] = pagination.encode_cursor("favorites", last.recipe_name, last.recipe_id)
+    return json
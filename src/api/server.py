@@ -1,5 +1,10 @@
+import asyncio
+
 from fastapi import FastAPI
+from src import favorite_counts
 from src.api import ingredients, recipes, pkg_util, users
+from src.passwords import hasher
+from src.reference_data import registry
 
 description = """
 Recipes API returns important information related to different recipes.
@@ -10,8 +15,14 @@ You can:
 * **retrieve a specific recipe by id.**
 * **list recipes with sorting and filtering options.**
 * **add a recipe to the database**
+* **bulk import recipes from NDJSON**
+* **export every recipe as NDJSON or CSV**
 * **modify an existing recipe**
+* **find recipes you can cook with the ingredients you have**
 * **favorite a recipe**
+* **favorite or unfavorite many recipes at once**
+* **see what else the users who favorited a recipe favorited**
+* **see which recipes are trending**
 * **view your favorited recipes**
 
 ## Ingredients
@@ -19,6 +30,7 @@ You can:
 You can:
 * **list ingredients with sorting and filtering options.**
 * **retrieve a specific ingredient by id**
+* **autocomplete ingredient names**
 
 ## Users
 
@@ -59,6 +71,29 @@ app.include_router(pkg_util.router)
 app.include_router(users.router)
 
 
+@app.on_event("startup")
+async def load_reference_data():
+    await registry.ensure_fresh()
+
+
+@app.on_event("startup")
+def start_favorite_folding():
+    if favorite_counts.FOLD_INTERVAL_SECONDS > 0:
+        app.state.favorite_folder = asyncio.create_task(favorite_counts.fold_forever())
+
+
+@app.on_event("shutdown")
+def stop_password_hasher():
+    hasher.shutdown()
+
+
+@app.on_event("shutdown")
+def stop_favorite_folding():
+    folder = getattr(app.state, "favorite_folder", None)
+    if folder is not None:
+        folder.cancel()
+
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Recipe API. See /docs for more information."}
@@ -1,14 +1,13 @@
-import base64
-import os
 from typing import List
 from fastapi import APIRouter, HTTPException
 import sqlalchemy
-import hashlib
+from sqlalchemy.dialects.postgresql import insert
 from pydantic import BaseModel
 
 
 
 from src import database as db
+from src.passwords import hasher, HasherBusy
 
 from fastapi.params import Query
 
@@ -21,7 +20,7 @@ class LoginJson(BaseModel):
 
 
 @router.post("/register_user/", tags=["add_user"])
-def add_user(LoginJson: LoginJson):
+async def add_user(LoginJson: LoginJson):
     """
     This endpoint will allow users to create a new user. The user must provide a username
     and password. This endpoint check to make sure no duplicate usernames can be used.
@@ -31,39 +30,28 @@ def add_user(LoginJson: LoginJson):
     username = LoginJson.username
     password = LoginJson.password
 
-    salt = os.urandom(32)
-    key = hashlib.pbkdf2_hmac('sha256', password.encode('utf-16'), salt, 100000)
-    hashed_password = salt + key
-
-    stmt = sqlalchemy.select(db.users.c.user_id).where(db.users.c.user_name == username)
-    with db.engine.begin() as conn:
-      check_valid = conn.execute(stmt)
-      if check_valid .rowcount > 0:
-        raise HTTPException(status_code=404, detail="username already exists")
-      
-      # Encode hashed password using base64 
-      encoded_password = base64.b64encode(hashed_password).decode('utf-8')
-
-      conn.execute(
-              sqlalchemy.insert(db.users),
-              [
-                  {"user_name": username,
-                  "password": encoded_password },
-              ],
-            
-      )
-
-      stmt = sqlalchemy.select(db.users.c.user_id, db.users.c.password).where(db.users.c.user_name == username)
-      result = conn.execute(stmt)
-      for row in result:
-         user_id = row.user_id
-         hashed_password = row.password
+    try:
+      encoded_password = await hasher.hash(password)
+    except HasherBusy:
+      raise HTTPException(status_code=503, detail="too many password requests, try again")
+
+    # the unique index on user_name settles concurrent signups for the same
+    # name: exactly one insert returns a row
+    stmt = (
+        insert(db.users)
+        .values(user_name=username, password=encoded_password)
+        .on_conflict_do_nothing(index_elements=[db.users.c.user_name])
+        .returning(db.users.c.user_id)
+    )
+    user_id = await db.run(lambda conn: conn.execute(stmt).scalar_one_or_none())
+    if user_id is None:
+      raise HTTPException(status_code=404, detail="username already exists")
 
     return {"user_id": user_id}
 
 
 @router.post("/login_user/", tags=["validate_user"])
-def validate_user_login(LoginJson: LoginJson):
+async def validate_user_login(LoginJson: LoginJson):
    """
     This endpoint will allow users to check if their password is valid. This endpoint 
     will throw an error if the user does not exist, or if the passowrd is incorrect.
@@ -73,22 +61,31 @@ def validate_user_login(LoginJson: LoginJson):
    password = LoginJson.password
 
    stmt = sqlalchemy.select(db.users.c.password).where(db.users.c.user_name == username)
-   with db.engine.begin() as conn:
-      result = conn.execute(stmt)
-      if result.rowcount == 0:
-        raise HTTPException(status_code=404, detail="user not found")
-      for row in result:
-         hashed_password = row.password
-
-    # Decode hashed password from base64
-   hashed_password = base64.b64decode(hashed_password.encode('utf-8'))
-
-   salt =hashed_password[:32]
-   key = hashed_password[32:]
-   check_key = hashlib.pbkdf2_hmac('sha256', password.encode('utf-16'), salt, 100000)
-
-   if key == check_key:
-        return {"message": "Password is correct"}
-   else:
+   hashed_password = await db.run(lambda conn: conn.execute(stmt).scalar_one_or_none())
+   if hashed_password is None:
+     raise HTTPException(status_code=404, detail="user not found")
+
+   try:
+     correct = await hasher.verify(password, hashed_password)
+   except HasherBusy:
+     raise HTTPException(status_code=503, detail="too many password requests, try again")
+
+   if not correct:
         return {"message": "Password is incorrect"}
-   
+
+   if hasher.needs_rehash(hashed_password):
+     # upgrade hashes made at an older cost while we know the password;
+     # skipped if the pool is busy, it will happen on a later login
+     try:
+       new_password = await hasher.hash(password)
+     except HasherBusy:
+       new_password = None
+     if new_password is not None:
+       await db.run(lambda conn: conn.execute(
+         sqlalchemy.update(db.users)
+         .where(db.users.c.user_name == username)
+         .where(db.users.c.password == hashed_password)
+         .values(password=new_password)
+       ))
+
+   return {"message": "Password is correct"}
@@ -0,0 +1,25 @@
+import numpy as np
+
+# Small numpy helpers shared by the in memory indexes. np.unique sorts with
+# extra bookkeeping that makes it several times slower than sorting and
+# comparing neighbours on the tens of millions of ids these indexes load.
+
+
+def first_of_runs(sorted_values):
+    """
+    Boolean mask marking the first of each run of equal values.
+    """
+    return np.concatenate(([True], sorted_values[1:] != sorted_values[:-1]))[:len(sorted_values)]
+
+
+def distinct_sorted(sorted_values):
+    return sorted_values[first_of_runs(sorted_values)]
+
+
+def run_offsets(sizes):
+    """
+    For runs of the given sizes laid end to end, the position of each
+    element within its run: run_offsets([2, 3]) == [0, 1, 0, 1, 2].
+    """
+    ends = np.cumsum(sizes)
+    return np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - sizes, sizes)
@@ -0,0 +1,177 @@
+import bisect
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import sqlalchemy
+
+from src import database as db
+from src.refreshing import RefreshingIndex
+
+# largest code point, so every key starting with a prefix sorts below prefix + _MAX_CHAR
+_MAX_CHAR = "\U0010ffff"
+
+
+def _key(name):
+    key = name.lower()
+    # share the string when the name is already lowercase
+    return name if key == name else key
+
+
+def _insert(entries, ingredient_id, name):
+    # a new (keys, names, ids, usage) tuple with the ingredient added, unused
+    keys, names, ids, usage = entries
+    key = _key(name)
+    i = bisect.bisect_left(keys, key)
+    if i < len(keys) and keys[i] == key:
+        if ingredient_id < ids[i]:
+            ids = ids.copy()
+            ids[i] = ingredient_id
+            names = names[:i] + [name] + names[i + 1:]
+        return keys, names, ids, usage
+    return (
+        keys[:i] + [key] + keys[i:],
+        names[:i] + [name] + names[i:],
+        np.insert(ids, i, ingredient_id),
+        np.insert(usage, i, 0),
+    )
+
+
+class PrefixIndex(RefreshingIndex):
+    """
+    In memory type-ahead index over ingredient names.
+
+    Names are kept lowercased in one sorted list, so the names starting with
+    a prefix are a contiguous slice found with two binary searches. Ids and
+    recipe usage counts sit in numpy arrays parallel to it, and the top-k by
+    usage inside a slice is found with a partial sort (np.partition).
+
+    Ingredients that share a name (ignoring case) are one entry, with the
+    lowest id and their usage summed. The index is rebuilt from the database
+    once older than `refresh_seconds`, which also picks up usage changes;
+    ingredients added through the API are inserted as they are created.
+    Inserts that may have come after a rebuild read the database are
+    replayed onto the rebuilt index.
+
+    Each rebuild or insert swaps in a new (keys, names, ids, usage) tuple, so
+    lookups never see a half updated index and need no lock.
+    """
+
+    description = "ingredient autocomplete index"
+
+    def __init__(self, refresh_seconds, clock=time.monotonic):
+        super().__init__(refresh_seconds, clock)
+        # held just around replacing _entries, never across database calls
+        self._swap_lock = threading.Lock()
+        # bumped by every insert, so a rebuild knows which inserts it may
+        # have missed
+        self._version = 0
+        # (version, ingredient_id, name) of the inserts a rebuild may replay
+        self._added = []
+        self._entries = ([], [], np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32))
+
+    def fetch(self, conn):
+        with self._swap_lock:
+            version = self._version
+        usage = (
+            sqlalchemy.select(
+                db.ingredient_quantities.c.ingredient_id,
+                sqlalchemy.func.count().label("recipe_count"),
+            )
+            .group_by(db.ingredient_quantities.c.ingredient_id)
+            .subquery()
+        )
+        return version, conn.execute(
+            sqlalchemy.select(
+                db.ingredients.c.ingredient_id,
+                db.ingredients.c.ingredient_name,
+                sqlalchemy.func.coalesce(usage.c.recipe_count, 0),
+            ).select_from(
+                db.ingredients.outerjoin(usage, usage.c.ingredient_id == db.ingredients.c.ingredient_id)
+            )
+        ).all()
+
+    def install(self, fetched):
+        version, rows = fetched
+        self.build(rows, since=version)
+
+    def build(self, rows, since=None):
+        """
+        Replaces the index with the given (ingredient_id, name, recipe_count)
+        rows. Inserts newer than version `since` are replayed on top; by
+        default none are.
+        """
+        entries = {}
+        for ingredient_id, name, recipe_count in rows:
+            key = _key(name)
+            entry = entries.get(key)
+            if entry is None:
+                entries[key] = [name, ingredient_id, recipe_count]
+            else:
+                if ingredient_id < entry[1]:
+                    entry[0], entry[1] = name, ingredient_id
+                entry[2] += recipe_count
+
+        keys = sorted(entries)
+        names = [entries[key][0] for key in keys]
+        ids = np.fromiter((entries[key][1] for key in keys), dtype=np.int32, count=len(keys))
+        usage = np.fromiter((entries[key][2] for key in keys), dtype=np.int32, count=len(keys))
+        with self._swap_lock:
+            self._added = [] if since is None else [added for added in self._added if added[0] > since]
+            rebuilt = (keys, names, ids, usage)
+            # replaying one the rebuild already read changes nothing
+            for _, ingredient_id, name in self._added:
+                rebuilt = _insert(rebuilt, ingredient_id, name)
+            self._entries = rebuilt
+            self._loaded_at = self._clock()
+
+    def add(self, ingredient_id, name):
+        """
+        Inserts a newly created ingredient, unused so far.
+        """
+        with self._swap_lock:
+            self._version += 1
+            self._added.append((self._version, ingredient_id, name))
+            self._entries = _insert(self._entries, ingredient_id, name)
+
+    def search(self, prefix, limit=10):
+        """
+        Returns up to `limit` (ingredient_id, name, recipe_count) tuples whose
+        name starts with `prefix` (ignoring case), most used first and then by
+        name.
+        """
+        keys, names, ids, usage = self._entries
+        prefix = prefix.lower()
+        lo = bisect.bisect_left(keys, prefix)
+        hi = bisect.bisect_left(keys, prefix + _MAX_CHAR, lo)
+        if hi - lo > limit:
+            # the limit-th highest usage in the slice, then everything above
+            # it plus the first ties in name order
+            segment = usage[lo:hi]
+            threshold = np.partition(segment, len(segment) - limit)[len(segment) - limit]
+            above = np.flatnonzero(segment > threshold)
+            ties = np.flatnonzero(segment == threshold)[:limit - len(above)]
+            candidates = np.concatenate([above, ties]) + lo
+        else:
+            candidates = np.arange(lo, hi)
+        candidates = sorted(candidates.tolist(), key=lambda i: (-int(usage[i]), i))
+        return [(int(ids[i]), names[i], int(usage[i])) for i in candidates]
+
+    def stats(self):
+        keys, names, ids, usage = self._entries
+        names_bytes = sum(sys.getsizeof(name) for name in names)
+        # keys of names that are already lowercase are the name objects themselves
+        keys_bytes = sum(sys.getsizeof(key) for key, name in zip(keys, names) if key is not name)
+        return {
+            "entries": len(keys),
+            "bytes": sys.getsizeof(keys) + sys.getsizeof(names) + keys_bytes + names_bytes + ids.nbytes + usage.nbytes,
+            "loaded_seconds_ago": None if self._loaded_at is None else self._clock() - self._loaded_at,
+            "refresh_seconds": self.refresh_seconds,
+        }
+
+
+ingredient_autocomplete = PrefixIndex(
+    refresh_seconds=float(os.environ.get("INGREDIENT_AUTOCOMPLETE_REFRESH_SECONDS", 300)),
+)
@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread safe LRU cache with a time to live and a memory cap.
+
+    Entry sizes are estimated from the length of the value's json encoding, so
+    `max_bytes` bounds the cached payloads rather than exact interpreter
+    memory. Entries older than `ttl_seconds` are treated as misses.
+
+    A reader that misses takes generation(key) before fetching the value and
+    passes it to set(). invalidate() bumps the key's generation, so a value
+    fetched before a write committed is dropped instead of being cached
+    until it expires. Generations live in a fixed table of
+    `generation_slots` counters indexed by the key's hash: a write to
+    another key in the same slot only costs a skipped set.
+    """
+
+    def __init__(self, max_bytes, ttl_seconds, clock=time.monotonic, generation_slots=4096):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (expires_at, size, value), least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generations = [0] * generation_slots
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_sets = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = entry
+            if expires_at <= self._clock():
+                self._remove(key, size)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self, key):
+        with self._lock:
+            return self._generations[hash(key) % len(self._generations)]
+
+    def set(self, key, value, generation=None):
+        """
+        Caches `value` under `key`, unless the key was invalidated since
+        `generation` was taken.
+        """
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes or self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generations[hash(key) % len(self._generations)]:
+                self.stale_sets += 1
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (self._clock() + self.ttl_seconds, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest, (_, oldest_size, _) = next(iter(self._entries.items()))
+                self._remove(oldest, oldest_size)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            # even with nothing cached, a reader may be fetching the old value
+            self._generations[hash(key) % len(self._generations)] += 1
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._remove(key, entry[1])
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale_sets": self.stale_sets,
+            }
+
+    def _remove(self, key, size):
+        del self._entries[key]
+        self._bytes -= size
+
+
+# GET /recipes/{recipe_id} responses, keyed by recipe_id. Writers invalidate
+# the recipes they change once their transaction has committed.
+recipe_cache = LRUCache(
+    max_bytes=int(os.environ.get("RECIPE_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    ttl_seconds=float(os.environ.get("RECIPE_CACHE_TTL_SECONDS", 60)),
+)
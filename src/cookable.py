@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+
+import numpy as np
+import sqlalchemy
+
+from src import database as db
+from src.arrays import distinct_sorted, first_of_runs
+from src.refreshing import RefreshingIndex
+
+# ingredients read per fetch while loading; each comes with its whole
+# recipe id array, so a load holds a few of those as Python lists at once
+LOAD_CHUNK_INGREDIENTS = 100
+
+
+class IngredientRecipeIndex(RefreshingIndex):
+    """
+    In memory inverted index from ingredients to the recipes that use them,
+    for finding the recipes that can be made from a set of ingredients.
+
+    The index is one CSR layout of numpy arrays: recipe ids sorted in
+    `recipe_ids`, the number of distinct ingredients of each in `sizes`, and
+    for every ingredient in `ingredient_ids` a sorted slice
+    `postings[offsets[i]:offsets[i + 1]]` of positions into `recipe_ids`.
+    A search adds up the posting slices of the requested ingredients with
+    one np.bincount, which gives how many of them every recipe uses, and the
+    recipes missing at most `max_missing` ingredients are ranked by coverage.
+
+    The arrays are rebuilt from the database once older than
+    `refresh_seconds`. Recipes added or changed through the API in between
+    go to a small overlay of recipe id -> ingredient ids that shadows their
+    base entry, since splicing them into the arrays would copy all of them
+    on every write. A rebuild drops the overlay entries it has read.
+
+    Each rebuild or write swaps in a new (base, overlay) tuple, so lookups
+    never see a half updated index and need no lock.
+    """
+
+    description = "cookable recipes index"
+
+    def __init__(self, refresh_seconds, clock=time.monotonic):
+        super().__init__(refresh_seconds, clock)
+        # held just around replacing _entries, never across database calls
+        self._swap_lock = threading.Lock()
+        # bumped by every overlay write, so a rebuild knows which writes it
+        # may have missed
+        self._version = 0
+        self._entries = (self._base(np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)), {})
+
+    def fetch(self, conn):
+        with self._swap_lock:
+            version = self._version
+        # one row per ingredient: converting a few thousand arrays is far
+        # cheaper than millions of (recipe_id, ingredient_id) row tuples
+        quantities = db.ingredient_quantities
+        result = conn.execution_options(yield_per=LOAD_CHUNK_INGREDIENTS).execute(
+            sqlalchemy.select(quantities.c.ingredient_id, sqlalchemy.func.array_agg(quantities.c.recipe_id))
+            .group_by(quantities.c.ingredient_id)
+        )
+        ingredient_ids, recipe_arrays = [], []
+        for ingredient_id, recipe_ids in result:
+            ingredient_ids.append(ingredient_id)
+            recipe_arrays.append(np.array(recipe_ids, dtype=np.int32))
+        return version, ingredient_ids, recipe_arrays
+
+    def install(self, fetched):
+        version, ingredient_ids, recipe_arrays = fetched
+        recipe_column = np.concatenate(recipe_arrays) if recipe_arrays else np.empty(0, dtype=np.int32)
+        ingredient_column = np.repeat(
+            np.array(ingredient_ids, dtype=np.int32), [len(recipe_ids) for recipe_ids in recipe_arrays]
+        )
+        self.build_arrays(recipe_column, ingredient_column, since=version)
+
+    @staticmethod
+    def _base(recipe_column, ingredient_column):
+        # one int64 key per pair orders them by ingredient and then recipe
+        keys = distinct_sorted(np.sort((ingredient_column.astype(np.int64) << 32) | recipe_column.astype(np.int64)))
+        ingredients = (keys >> 32).astype(np.int32)
+        recipes = (keys & 0xFFFFFFFF).astype(np.int32)
+        recipe_ids = distinct_sorted(np.sort(recipes))
+        positions = np.searchsorted(recipe_ids, recipes).astype(np.int32)
+        sizes = np.bincount(positions, minlength=len(recipe_ids)).astype(np.int32)
+        starts = np.flatnonzero(first_of_runs(ingredients))
+        offsets = np.append(starts, len(keys)).astype(np.int64)
+        return recipe_ids, sizes, ingredients[starts], offsets, positions
+
+    def build(self, rows):
+        """
+        Replaces the index with the given (recipe_id, ingredient_id) rows.
+        """
+        pairs = np.array(list(rows), dtype=np.int32).reshape(-1, 2)
+        self.build_arrays(pairs[:, 0], pairs[:, 1])
+
+    def build_arrays(self, recipe_column, ingredient_column, since=None):
+        """
+        Replaces the index with the pairs of two parallel id arrays. Overlay
+        writes newer than version `since` are kept; by default none are.
+        """
+        base = self._base(recipe_column, ingredient_column)
+        with self._swap_lock:
+            overlay = {} if since is None else {
+                recipe_id: entry for recipe_id, entry in self._entries[1].items() if entry[0] > since
+            }
+            self._entries = (base, overlay)
+            self._loaded_at = self._clock()
+
+    def set_recipe(self, recipe_id, ingredient_ids):
+        """
+        Records the current ingredients of a recipe added or changed since
+        the last rebuild.
+        """
+        with self._swap_lock:
+            self._version += 1
+            base, overlay = self._entries
+            self._entries = (base, {**overlay, recipe_id: (self._version, frozenset(ingredient_ids))})
+
+    def search(self, ingredient_ids, max_missing=0, limit=20):
+        """
+        Returns up to `limit` (recipe_id, matched, total) tuples for the
+        recipes that use at least one of `ingredient_ids` and need at most
+        `max_missing` others, where `matched` of the recipe's `total`
+        distinct ingredients are in `ingredient_ids`. Ordered by coverage
+        (matched / total), then fewest missing, then most matched, then id.
+        """
+        (recipe_ids, sizes, index_ids, offsets, postings), overlay = self._entries
+        have = np.unique(np.asarray(list(ingredient_ids), dtype=np.int64))
+        found = np.searchsorted(index_ids, have[np.isin(have, index_ids)])
+
+        matched = np.bincount(
+            np.concatenate([postings[offsets[i]:offsets[i + 1]] for i in found] or [np.empty(0, dtype=np.int32)]),
+            minlength=len(recipe_ids),
+        )
+        if overlay:
+            # the overlay holds the current ingredients of these recipes
+            overlay_ids = np.fromiter(overlay, dtype=np.int32, count=len(overlay))
+            positions = np.searchsorted(recipe_ids, overlay_ids)
+            inside = positions < len(recipe_ids)
+            positions = positions[inside]
+            matched[positions[recipe_ids[positions] == overlay_ids[inside]]] = 0
+        candidates = np.flatnonzero((matched > 0) & (sizes - matched <= max_missing))
+
+        if len(candidates) > limit:
+            # only candidates with coverage up to the limit-th best can make
+            # the page; the ties at that coverage are settled by the sort
+            coverage = matched[candidates] / sizes[candidates]
+            threshold = np.partition(coverage, len(coverage) - limit)[len(coverage) - limit]
+            candidates = candidates[coverage >= threshold]
+        found_matched = matched[candidates]
+        found_sizes = sizes[candidates]
+        order = np.lexsort((
+            recipe_ids[candidates], -found_matched, found_sizes - found_matched, -found_matched / found_sizes,
+        ))[:limit]
+        results = [
+            (int(recipe_ids[candidates[i]]), int(found_matched[i]), int(found_sizes[i])) for i in order
+        ]
+
+        have = set(have.tolist())
+        for recipe_id, (_, ingredients) in overlay.items():
+            count = len(ingredients & have)
+            if count and len(ingredients) - count <= max_missing:
+                results.append((recipe_id, count, len(ingredients)))
+        results.sort(key=lambda r: (-r[1] / r[2], r[2] - r[1], -r[1], r[0]))
+        return results[:limit]
+
+    def stats(self):
+        base, overlay = self._entries
+        recipe_ids, sizes, ingredient_ids, offsets, postings = base
+        return {
+            "recipes": len(recipe_ids),
+            "ingredients": len(ingredient_ids),
+            "pairs": len(postings),
+            "overlay_recipes": len(overlay),
+            "bytes": sum(array.nbytes for array in base),
+            "loaded_seconds_ago": None if self._loaded_at is None else self._clock() - self._loaded_at,
+            "refresh_seconds": self.refresh_seconds,
+        }
+
+
+cookable_recipes = IngredientRecipeIndex(
+    refresh_seconds=float(os.environ.get("COOKABLE_INDEX_REFRESH_SECONDS", 300)),
+)
@@ -1,10 +1,11 @@
-import csv
 import os
-import io
-from supabase import Client, create_client
+import threading
+import time
 import dotenv
-from sqlalchemy import create_engine
 import sqlalchemy
+import sqlalchemy.pool
+from sqlalchemy.dialects import postgresql
+from starlette.concurrency import run_in_threadpool
 
 
 
@@ -17,18 +18,366 @@ def database_connection_url():
     DB_NAME: str = os.environ.get("POSTGRES_DB")
     return f"postgresql://{DB_USER}:{DB_PASSWD}@{DB_SERVER}:{DB_PORT}/{DB_NAME}"
 
-engine = sqlalchemy.create_engine(database_connection_url())
 
-conn = engine.connect()
+class _PoolInstrumentation:
+    """
+    Mixin for QueuePool and its asyncio twin that records how many callers
+    are waiting for a connection and how long checkouts take, so pool sizes
+    can be picked from data.
+    """
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        with self._stats_lock:
+            self.waiting += 1
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except sqlalchemy.exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.waiting -= 1
+                self.total_wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        with self._stats_lock:
+            self.checkouts += 1
+        return connection
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "size": self.size(),
+                "checked_out": self.checkedout(),
+                "checked_in": self.checkedin(),
+                "overflow": self.overflow(),
+                "max_overflow": self._max_overflow,
+                "waiting": self.waiting,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": self.total_wait_seconds * 1000 / self.checkouts if self.checkouts else 0.0,
+                "max_wait_ms": self.max_wait_seconds * 1000,
+            }
+
+
+class InstrumentedQueuePool(_PoolInstrumentation, sqlalchemy.pool.QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_PoolInstrumentation, sqlalchemy.pool.AsyncAdaptedQueuePool):
+    # _do_get runs in the greenlet AsyncConnection spawns to check out, so
+    # the timing includes the awaited wait for a connection
+    pass
+
+
+# Connection pool profiles, picked with DB_POOL_PROFILE:
+# * `serverless`: no pooling, every checkout opens a fresh connection. Safe
+#   behind a transaction mode pooler such as PgBouncer or Supabase's pooler,
+#   and right for short lived serverless instances.
+# * `fixed`: a fixed size pool for long running workers; connections are
+#   pinged before use and recycled so idle ones dropped by a pooler or load
+#   balancer are never handed out.
+# * `burst`: like `fixed`, but may open overflow connections under load.
+# DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT and DB_POOL_RECYCLE override
+# the profile's numbers.
+POOL_PROFILES = {
+    "serverless": {"poolclass": sqlalchemy.pool.NullPool},
+    "fixed": {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": 10,
+        "max_overflow": 0,
+        "pool_timeout": 30,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+    },
+    "burst": {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_timeout": 30,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+    },
+}
+
+POOL_OVERRIDES = {
+    "DB_POOL_SIZE": ("pool_size", int),
+    "DB_MAX_OVERFLOW": ("max_overflow", int),
+    "DB_POOL_TIMEOUT": ("pool_timeout", float),
+    "DB_POOL_RECYCLE": ("pool_recycle", int),
+}
+
+
+def pool_options(profile=None):
+    """
+    Returns the create_engine() keyword arguments for a pool profile,
+    defaulting to DB_POOL_PROFILE (or `burst`).
+    """
+    profile = profile or os.environ.get("DB_POOL_PROFILE", "burst")
+    if profile not in POOL_PROFILES:
+        raise ValueError(f"unknown DB_POOL_PROFILE {profile!r}, expected one of {sorted(POOL_PROFILES)}")
+    options = dict(POOL_PROFILES[profile])
+    if options["poolclass"] is not sqlalchemy.pool.NullPool:
+        for variable, (option, convert) in POOL_OVERRIDES.items():
+            if os.environ.get(variable):
+                options[option] = convert(os.environ[variable])
+    return profile, options
+
+
+_engine = None
+_engine_lock = threading.Lock()
+_pool_profile = None
+
+
+def get_engine():
+    """
+    Creates the engine on first use, so importing this module never opens a
+    connection or reads the environment.
+    """
+    global _engine, _pool_profile
+    if _engine is None:
+        # threadpool requests can arrive here together on a cold start, and
+        # each would otherwise create an engine with a pool of its own
+        with _engine_lock:
+            if _engine is None:
+                dotenv.load_dotenv()
+                _pool_profile, options = pool_options()
+                _engine = sqlalchemy.create_engine(database_connection_url(), **options)
+    return _engine
+
+
+def _engine_pool_stats(engine):
+    if engine is None:
+        return None
+    if isinstance(engine.pool, _PoolInstrumentation):
+        return engine.pool.stats()
+    return {"status": engine.pool.status()}
+
+
+def pool_stats():
+    """
+    Returns the pool profile in use and the live counters of each engine
+    created so far. Under DB_ASYNC requests use the async engine, while
+    streams and startup loads still check out from the sync one.
+    """
+    return {
+        "profile": _pool_profile,
+        "sync": _engine_pool_stats(_engine),
+        "async": _engine_pool_stats(_async_engine.sync_engine if _async_engine is not None else None),
+    }
+
+
+def use_async():
+    """
+    True when DB_ASYNC selects the asyncpg engine for request handling.
+    """
+    return os.environ.get("DB_ASYNC", "").lower() in ("1", "true", "yes")
+
+
+_async_engine = None
+
+
+def get_async_engine():
+    """
+    Creates the asyncpg backed engine on first use, with the same pool
+    profile as the sync engine.
+    """
+    global _async_engine, _pool_profile
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        dotenv.load_dotenv()
+        _pool_profile, options = pool_options()
+        url = database_connection_url().replace("postgresql://", "postgresql+asyncpg://", 1)
+        if options["poolclass"] is sqlalchemy.pool.NullPool:
+            # transaction mode poolers can't keep prepared statements around
+            url += "?prepared_statement_cache_size=0"
+            options["connect_args"] = {"statement_cache_size": 0}
+        else:
+            # QueuePool blocks threads; the async engine needs its asyncio twin
+            options["poolclass"] = InstrumentedAsyncQueuePool
+        _async_engine = create_async_engine(url, **options)
+    return _async_engine
+
+
+def _run_in_transaction(fn, *args):
+    with get_engine().begin() as conn:
+        return fn(conn, *args)
+
+
+async def run(fn, *args):
+    """
+    Calls `fn(conn, *args)` inside a transaction and returns its result.
+
+    With DB_ASYNC set the transaction runs on the asyncpg engine and `conn`
+    is a sync facade driven by `AsyncConnection.run_sync`, so no thread waits
+    on Postgres. Otherwise it runs on the psycopg2 engine in the threadpool,
+    as sync endpoints did. Either way `fn` is ordinary Connection code.
+    """
+    if use_async():
+        async with get_async_engine().begin() as conn:
+            return await conn.run_sync(fn, *args)
+    return await run_in_threadpool(_run_in_transaction, fn, *args)
+
+
+def _open_stream(stmt):
+    conn = get_engine().connect()
+    try:
+        return conn, conn.execution_options(stream_results=True).execute(stmt)
+    except BaseException:
+        conn.close()
+        raise
+
+
+async def stream(stmt, batch_size=1000):
+    """
+    Yields the rows of `stmt` in lists of up to `batch_size`, read from a
+    server side cursor so the full result is never held in memory.
+
+    Like run(), uses the asyncpg engine with DB_ASYNC set and otherwise the
+    psycopg2 engine, fetching each batch in the threadpool. The connection
+    is held until the generator is exhausted or closed.
+    """
+    if use_async():
+        async with get_async_engine().connect() as conn:
+            result = await conn.stream(stmt)
+            async for rows in result.partitions(batch_size):
+                yield rows
+        return
+
+    conn, result = await run_in_threadpool(_open_stream, stmt)
+    try:
+        while True:
+            rows = await run_in_threadpool(result.fetchmany, batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        await run_in_threadpool(conn.close)
+
+
+def __getattr__(name):
+    # keeps `db.engine` and `db.async_engine` working while deferring engine creation
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Table definitions mirror the Alembic revisions in alembic/versions instead
+# of being reflected at import time. Add new columns and indexes here in the
+# same change as their migration; alembic/env.py compares against this
+# metadata.
 metadata_obj = sqlalchemy.MetaData()
 
-recipes = sqlalchemy.Table("recipes", metadata_obj, autoload_with=engine)
-ingredients = sqlalchemy.Table("ingredients", metadata_obj, autoload_with=engine)
-ingredient_quantities = sqlalchemy.Table("ingredient_quantities", metadata_obj, autoload_with=engine)
-cuisine_type = sqlalchemy.Table("cuisine_type", metadata_obj, autoload_with=engine)
-meal_type = sqlalchemy.Table("meal_type", metadata_obj, autoload_with=engine)
-favorited_recipes = sqlalchemy.Table("favorited_recipes", metadata_obj, autoload_with=engine)
-users = sqlalchemy.Table("users", metadata_obj, autoload_with=engine)
-recipe_cuisine_types = sqlalchemy.Table("recipe_cuisine_types", metadata_obj, autoload_with=engine)
-recipe_meal_types = sqlalchemy.Table("recipe_meal_types", metadata_obj, autoload_with=engine)
+meal_type = sqlalchemy.Table(
+    "meal_type", metadata_obj,
+    sqlalchemy.Column("meal_type_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("meal_type", sqlalchemy.String(50), nullable=False),
+)
+
+cuisine_type = sqlalchemy.Table(
+    "cuisine_type", metadata_obj,
+    sqlalchemy.Column("cuisine_type_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("cuisine_type", sqlalchemy.String(50), nullable=False),
+)
+
+favorited_recipes = sqlalchemy.Table(
+    "favorited_recipes", metadata_obj,
+    sqlalchemy.Column("recipe_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("user_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("date_favorited", sqlalchemy.DateTime(timezone=True), nullable=True, server_default=sqlalchemy.func.now()),
+    sqlalchemy.ForeignKeyConstraint(["user_id"], ["users.user_id"], name="favorited_recipes_user_id_fkey"),
+    sqlalchemy.ForeignKeyConstraint(["recipe_id"], ["recipes.recipe_id"], name="favorited_recipes_recipe_id_fkey"),
+    sqlalchemy.Index("ix_favorited_recipes_user_id_recipe_id", "user_id", "recipe_id"),
+    sqlalchemy.Index("ix_favorited_recipes_date_favorited_recipe_id", "date_favorited", "recipe_id"),
+)
+
+ingredient_quantities = sqlalchemy.Table(
+    "ingredient_quantities", metadata_obj,
+    sqlalchemy.Column("recipe_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("ingredient_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("amount", sqlalchemy.String(50), nullable=True),
+    sqlalchemy.Column("unit_type", sqlalchemy.String(50), nullable=True),
+    sqlalchemy.Column("ingredient_price_usd", sqlalchemy.Float, nullable=True),
+    sqlalchemy.Index("ix_ingredient_quantities_ingredient_id_recipe_id", "ingredient_id", "recipe_id"),
+)
+
+ingredients = sqlalchemy.Table(
+    "ingredients", metadata_obj,
+    sqlalchemy.Column("ingredient_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("ingredient_name", sqlalchemy.String(50), nullable=False),
+)
+
+recipe_cuisine_types = sqlalchemy.Table(
+    "recipe_cuisine_types", metadata_obj,
+    sqlalchemy.Column("recipe_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("cuisine_type_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Index("ix_recipe_cuisine_types_cuisine_type_id_recipe_id", "cuisine_type_id", "recipe_id"),
+)
+
+recipe_meal_types = sqlalchemy.Table(
+    "recipe_meal_types", metadata_obj,
+    sqlalchemy.Column("recipe_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("meal_type_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Index("ix_recipe_meal_types_meal_type_id_recipe_id", "meal_type_id", "recipe_id"),
+)
+
+recipes = sqlalchemy.Table(
+    "recipes", metadata_obj,
+    sqlalchemy.Column("recipe_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("recipe_name", sqlalchemy.String(50), nullable=False),
+    sqlalchemy.Column("calories", sqlalchemy.Integer, nullable=True),
+    sqlalchemy.Column("prep_time_mins", sqlalchemy.Integer, nullable=True),
+    sqlalchemy.Column("recipe_instructions", sqlalchemy.String(50), nullable=True),
+    sqlalchemy.Column("recipe_url", sqlalchemy.String(50), nullable=True),
+    sqlalchemy.Column("number_of_favorites", sqlalchemy.Integer, nullable=True),
+    sqlalchemy.Column("total_cost_usd", sqlalchemy.Float, nullable=True),
+)
+sqlalchemy.Index("ix_recipes_recipe_name_recipe_id", recipes.c.recipe_name, recipes.c.recipe_id)
+sqlalchemy.Index("ix_recipes_prep_time_mins_recipe_id", recipes.c.prep_time_mins, recipes.c.recipe_id)
+sqlalchemy.Index(
+    "ix_recipes_number_of_favorites_recipe_id",
+    recipes.c.number_of_favorites.desc().nulls_last(), recipes.c.recipe_id,
+)
+sqlalchemy.Index("ix_recipes_total_cost_usd_recipe_id", recipes.c.total_cost_usd, recipes.c.recipe_id)
+sqlalchemy.Index("ix_recipes_calories_recipe_id", recipes.c.calories, recipes.c.recipe_id)
+sqlalchemy.Index(
+    "ix_recipes_recipe_name_trgm", recipes.c.recipe_name,
+    postgresql_using="gin", postgresql_ops={"recipe_name": "gin_trgm_ops"},
+)
+
+users = sqlalchemy.Table(
+    "users", metadata_obj,
+    sqlalchemy.Column("user_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("user_name", sqlalchemy.String(50), nullable=False),
+    sqlalchemy.Column("password", sqlalchemy.Text, nullable=False),
+    sqlalchemy.Index("ix_users_user_name", "user_name", unique=True),
+)
+
+recipe_documents = sqlalchemy.Table(
+    "recipe_documents", metadata_obj,
+    sqlalchemy.Column("recipe_id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("document", postgresql.JSONB, nullable=False),
+    sqlalchemy.Column("updated_at", sqlalchemy.DateTime(timezone=True), nullable=False, server_default=sqlalchemy.func.now()),
+)
+
+recipe_favorite_deltas = sqlalchemy.Table(
+    "recipe_favorite_deltas", metadata_obj,
+    sqlalchemy.Column("delta_id", sqlalchemy.BigInteger, sqlalchemy.Identity(), primary_key=True),
+    sqlalchemy.Column("recipe_id", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("delta", sqlalchemy.SmallInteger, nullable=False),
+    sqlalchemy.Column("created_at", sqlalchemy.DateTime(timezone=True), nullable=False, server_default=sqlalchemy.func.now()),
+)
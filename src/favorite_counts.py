@@ -0,0 +1,149 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+import sqlalchemy
+
+from src import database as db, recipe_documents
+from src.cache import recipe_cache
+
+# Favoriting a recipe used to UPDATE its recipes row, so every user
+# favoriting a popular recipe queued on that one row lock. Favorites now
+# append a +1/-1 row to recipe_favorite_deltas, which never conflicts, and
+# fold() periodically moves the pending deltas into
+# recipes.number_of_favorites, one row update per recipe per batch.
+#
+# Counts, the list sort and recipe documents in the database lag by about
+# one fold interval. Cached GET /recipes/{id} responses can lag longer:
+# only the process that folded drops its cached copies of the changed
+# recipes, and every other API process serves its copy until it expires.
+# A count shown is therefore up to one fold interval plus
+# RECIPE_CACHE_TTL_SECONDS behind.
+#
+# The API folds in the background every FAVORITE_FOLD_INTERVAL_SECONDS
+# (0 disables it). Serverless instances (Vercel) are frozen between
+# requests, so that task can't be relied on there: set the interval to 0
+# and run `python -m src.favorite_counts --every N` as a separate job.
+# Folders lock the deltas they take with SKIP LOCKED, so any number of them
+# can run at once.
+
+logger = logging.getLogger(__name__)
+
+FOLD_INTERVAL_SECONDS = float(os.environ.get("FAVORITE_FOLD_INTERVAL_SECONDS", 2))
+FOLD_BATCH_SIZE = int(os.environ.get("FAVORITE_FOLD_BATCH_SIZE", 10000))
+
+
+def record(conn, recipe_id, delta):
+    """
+    Appends a pending change of `delta` to the recipe's favorite count.
+    """
+    conn.execute(sqlalchemy.insert(db.recipe_favorite_deltas).values(recipe_id=recipe_id, delta=delta))
+
+
+def record_from(recipe_ids, delta):
+    """
+    INSERT appending `delta` for every row of `recipe_ids`, a select of
+    recipe ids. Meant to run as a CTE of the statement that changed the
+    favorites, so counting costs no extra round trip.
+    """
+    return sqlalchemy.insert(db.recipe_favorite_deltas).from_select(
+        ["recipe_id", "delta"], recipe_ids.add_columns(sqlalchemy.literal(delta, sqlalchemy.SmallInteger))
+    )
+
+
+def fold_batch(conn, batch_size=FOLD_BATCH_SIZE):
+    """
+    Moves up to `batch_size` of the oldest pending deltas into
+    recipes.number_of_favorites and refreshes the documents of the recipes
+    whose count changed. Returns the number of deltas taken and the ids of
+    those recipes.
+    """
+    deltas = db.recipe_favorite_deltas
+    taken = (
+        sqlalchemy.select(deltas.c.delta_id)
+        .order_by(deltas.c.delta_id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    moved = conn.execute(
+        sqlalchemy.delete(deltas)
+        .where(deltas.c.delta_id.in_(taken))
+        .returning(deltas.c.recipe_id, deltas.c.delta)
+    ).all()
+
+    totals = {}
+    for recipe_id, delta in moved:
+        totals[recipe_id] = totals.get(recipe_id, 0) + delta
+    totals = [(recipe_id, delta) for recipe_id, delta in sorted(totals.items()) if delta != 0]
+    if not totals:
+        return len(moved), []
+
+    # one UPDATE for the whole batch, joined against the per recipe totals
+    sums = sqlalchemy.values(
+        sqlalchemy.column("recipe_id", sqlalchemy.Integer),
+        sqlalchemy.column("delta", sqlalchemy.Integer),
+        name="sums",
+    ).data(totals)
+    recipe_ids = conn.execute(
+        sqlalchemy.update(db.recipes)
+        .where(db.recipes.c.recipe_id == sums.c.recipe_id)
+        .values(number_of_favorites=db.recipes.c.number_of_favorites + sums.c.delta)
+        .returning(db.recipes.c.recipe_id)
+    ).scalars().all()
+    recipe_documents.refresh(conn, recipe_ids)
+    return len(moved), recipe_ids
+
+
+def pending(conn):
+    """
+    Returns the number of deltas not folded yet.
+    """
+    return conn.execute(sqlalchemy.select(sqlalchemy.func.count()).select_from(db.recipe_favorite_deltas)).scalar_one()
+
+
+def fold(batch_size=FOLD_BATCH_SIZE):
+    """
+    Folds every pending delta on the sync engine, one transaction per batch.
+    Returns the ids of the recipes whose count changed.
+    """
+    folded = set()
+    while True:
+        with db.engine.begin() as conn:
+            taken, recipe_ids = fold_batch(conn, batch_size)
+        folded.update(recipe_ids)
+        if taken < batch_size:
+            return folded
+
+
+async def fold_forever(interval=FOLD_INTERVAL_SECONDS, batch_size=FOLD_BATCH_SIZE):
+    """
+    Background task for the API process: folds pending deltas every
+    `interval` seconds and drops this process's cached responses of the
+    changed recipes. Other processes' copies expire on their own, after at
+    most RECIPE_CACHE_TTL_SECONDS.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            while True:
+                taken, recipe_ids = await db.run(fold_batch, batch_size)
+                for recipe_id in recipe_ids:
+                    recipe_cache.invalidate(recipe_id)
+                if taken < batch_size:
+                    break
+        except Exception:
+            # a failed fold leaves its deltas in place for the next round
+            logger.exception("folding favorite deltas failed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold pending favorite deltas into recipes.number_of_favorites")
+    parser.add_argument("--every", type=float, default=0, help="keep folding every N seconds")
+    args = parser.parse_args()
+    while True:
+        print(f"folded favorites of {len(fold())} recipes")
+        if args.every <= 0:
+            break
+        time.sleep(args.every)
@@ -0,0 +1,71 @@
+import base64
+import json
+
+import sqlalchemy
+
+# Keyset ("cursor") pagination helpers. A cursor is an opaque, url safe token
+# holding the sort option it was issued for and the sort key + id of the last
+# row on the page, so the next page can seek on an index instead of skipping
+# `offset` rows.
+
+
+def encode_cursor(sort: str, value, last_id: int) -> str:
+    payload = json.dumps({"s": sort, "v": value, "id": last_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, value_types=(int, float, str)):
+    """
+    Returns the (value, last_id) pair stored in the cursor. Raises ValueError
+    if the cursor is malformed, was issued for a different sort option, or
+    holds a value that is not one of `value_types` (or null).
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        cursor_sort, value, last_id = payload["s"], payload["v"], payload["id"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("invalid cursor")
+    if cursor_sort != sort:
+        raise ValueError("cursor does not match the requested sort")
+    # bools are ints to isinstance; ids and int keys must fit the int columns
+    if not _is_int(last_id) or (value is not None and (
+        isinstance(value, bool) or not isinstance(value, value_types)
+        or (isinstance(value, int) and not _is_int(value))
+    )):
+        raise ValueError("invalid cursor")
+    return value, last_id
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool) and -2 ** 31 <= value < 2 ** 31
+
+
+def seek_condition(column, id_column, value, last_id, descending=False):
+    """
+    Builds the WHERE clause selecting rows after (value, last_id) in
+    `ORDER BY column [DESC] NULLS LAST, id_column` order, as a range the
+    (column, id_column) index can start from.
+
+    Rows with a NULL sort key are only matched once `value` is NULL. After a
+    non NULL `value` the caller continues into that tail with
+    `seek_condition(column, id_column, None, 0)` when the page comes up short.
+    """
+    if value is None:
+        # already in the trailing block of NULL sort keys
+        return sqlalchemy.and_(column.is_(None), id_column > last_id)
+    if descending:
+        # the key descends but the id ascends, which a row comparison can't
+        # express; `column <= value` is the redundant bound the index seeks on
+        return sqlalchemy.and_(
+            column <= value,
+            sqlalchemy.or_(column < value, id_column > last_id),
+        )
+    return sqlalchemy.tuple_(column, id_column) > sqlalchemy.tuple_(value, last_id)
+
+
+def order_by(column, id_column, descending=False):
+    if descending:
+        return (column.desc().nulls_last(), id_column)
+    # NULLS LAST is already postgres' default for ascending order
+    return (column, id_column)
@@ -0,0 +1,150 @@
+import asyncio
+import base64
+import concurrent.futures
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+
+ALGORITHM = "pbkdf2_sha256"
+SALT_BYTES = 32
+# the cost of hashes written before the cost was stored with them
+LEGACY_ITERATIONS = 100000
+
+
+class HasherBusy(Exception):
+    """
+    Raised when the hashing pool already has `max_pending` calls queued.
+    """
+
+
+def _pbkdf2(password, salt, iterations):
+    # module level so the process pool can pickle it
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-16'), salt, iterations)
+
+
+def parse(stored):
+    """
+    Splits a stored password into (iterations, salt, key).
+
+    Hashes are stored as `pbkdf2_sha256$<iterations>$<base64 salt+key>`.
+    Older rows hold only the base64 part and were hashed with
+    LEGACY_ITERATIONS.
+    """
+    if stored.startswith(ALGORITHM + "$"):
+        _, iterations, encoded = stored.split("$", 2)
+        iterations = int(iterations)
+    else:
+        iterations, encoded = LEGACY_ITERATIONS, stored
+    raw = base64.b64decode(encoded.encode('utf-8'))
+    return iterations, raw[:SALT_BYTES], raw[SALT_BYTES:]
+
+
+def encode(iterations, salt, key):
+    return f"{ALGORITHM}${iterations}${base64.b64encode(salt + key).decode('utf-8')}"
+
+
+class PasswordHasher:
+    """
+    Runs PBKDF2 off the event loop in a pool of `workers` processes, so a
+    burst of logins uses spare cores instead of starving other requests.
+    `workers=0` uses the event loop's default thread executor instead, for hosts where spawning
+    processes is not worth it.
+
+    At most `max_pending` hashes may be queued or running at once; callers
+    beyond that get HasherBusy straight away rather than waiting behind the
+    queue.
+
+    New hashes use `iterations`; stored hashes with a lower cost (including
+    legacy ones) report needs_rehash so they can be upgraded on login.
+    """
+
+    def __init__(self, iterations, workers, max_pending):
+        self.iterations = iterations
+        self.workers = workers
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn rather than fork: the server process already runs
+                # threads (the threadpool, the db pool) that fork would copy
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    async def _derive(self, password, salt, iterations):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HasherBusy()
+            self._pending += 1
+        try:
+            executor = None if self.workers == 0 else self._get_executor()
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, _pbkdf2, password, salt, iterations)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def hash(self, password):
+        salt = os.urandom(SALT_BYTES)
+        key = await self._derive(password, salt, self.iterations)
+        return encode(self.iterations, salt, key)
+
+    async def verify(self, password, stored):
+        iterations, salt, key = parse(stored)
+        check_key = await self._derive(password, salt, iterations)
+        return hmac.compare_digest(key, check_key)
+
+    def needs_rehash(self, stored):
+        return parse(stored)[0] < self.iterations
+
+    def stats(self):
+        with self._lock:
+            return {
+                "iterations": self.iterations,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+def default_workers(environ):
+    """
+    The hashing pool size when PASSWORD_HASH_WORKERS is not set: one
+    process per core, or 0 (the thread executor) on serverless hosts. A
+    serverless instance serves one request at a time and is frozen between
+    them, so a pool would only add the seconds it takes to spawn the
+    processes to its cold start. Serverless is DB_POOL_PROFILE=serverless or
+    a host that says so: Vercel sets VERCEL, AWS Lambda
+    AWS_LAMBDA_FUNCTION_NAME.
+    """
+    if "PASSWORD_HASH_WORKERS" in environ:
+        return int(environ["PASSWORD_HASH_WORKERS"])
+    if environ.get("DB_POOL_PROFILE") == "serverless" or "VERCEL" in environ or "AWS_LAMBDA_FUNCTION_NAME" in environ:
+        return 0
+    return os.cpu_count() or 1
+
+
+# processes per core on a server, the thread executor on serverless hosts,
+# see default_workers()
+_workers = default_workers(os.environ)
+hasher = PasswordHasher(
+    iterations=int(os.environ.get("PASSWORD_HASH_ITERATIONS", LEGACY_ITERATIONS)),
+    workers=_workers,
+    max_pending=int(os.environ.get("PASSWORD_HASH_MAX_PENDING", max(_workers, 1) * 8)),
+)
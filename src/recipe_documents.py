@@ -0,0 +1,102 @@
+import sqlalchemy
+from sqlalchemy.dialects.postgresql import insert
+
+from src import database as db
+
+# Read model for GET /recipes/{recipe_id}. Every recipe has one row in
+# recipe_documents holding the fully assembled recipe json, so a detail view
+# is a primary key lookup instead of a six way join. Endpoints that change a
+# recipe call refresh() inside their transaction; `python -m
+# src.recipe_documents` rebuilds every document.
+
+
+def _key(name):
+    # keys are inlined so jsonb_build_object never sees untyped parameters
+    return sqlalchemy.literal_column(f"'{name}'")
+
+
+def name_list(name_column, lookup, bridge, join_column, recipe_id_column=db.recipes.c.recipe_id):
+    """
+    Correlated subquery collecting, as a json array, the distinct names linked
+    to the recipe in `recipe_id_column`. Each list is aggregated on its own, so
+    cuisines, meal types and ingredients don't multiply each other's rows.
+    Each name is looked up by primary key: joined, the planner hashes the
+    whole lookup table once per recipe.
+    """
+    name = sqlalchemy.select(name_column).where(lookup.c[join_column] == bridge.c[join_column]).scalar_subquery()
+    names = (
+        sqlalchemy.select(sqlalchemy.func.to_jsonb(sqlalchemy.func.ARRAY_AGG(sqlalchemy.distinct(name))))
+        .where(bridge.c.recipe_id == recipe_id_column)
+        .scalar_subquery()
+    )
+    return sqlalchemy.func.coalesce(names, sqlalchemy.literal_column("'[]'::jsonb"))
+
+
+def _document():
+    return sqlalchemy.func.jsonb_build_object(
+        _key("recipe_id"), db.recipes.c.recipe_id,
+        _key("recipe_name"), db.recipes.c.recipe_name,
+        _key("cuisine_type"), name_list(db.cuisine_type.c.cuisine_type, db.cuisine_type, db.recipe_cuisine_types, "cuisine_type_id"),
+        _key("meal_type"), name_list(db.meal_type.c.meal_type, db.meal_type, db.recipe_meal_types, "meal_type_id"),
+        _key("prep_time_mins"), db.recipes.c.prep_time_mins,
+        _key("instructions"), db.recipes.c.recipe_instructions,
+        _key("ingredients"), name_list(db.ingredients.c.ingredient_name, db.ingredients, db.ingredient_quantities, "ingredient_id"),
+        _key("number_of_favorites"), db.recipes.c.number_of_favorites,
+    )
+
+
+def _upsert(where_clause):
+    stmt = insert(db.recipe_documents).from_select(
+        ["recipe_id", "document"],
+        sqlalchemy.select(db.recipes.c.recipe_id, _document()).where(where_clause),
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[db.recipe_documents.c.recipe_id],
+        set_={"document": stmt.excluded.document, "updated_at": sqlalchemy.func.now()},
+    )
+
+
+def get(conn, recipe_id):
+    """
+    Returns the stored document for the recipe, or None if it has not been
+    built yet.
+    """
+    stmt = sqlalchemy.select(db.recipe_documents.c.document).where(db.recipe_documents.c.recipe_id == recipe_id)
+    return conn.execute(stmt).scalar_one_or_none()
+
+
+def refresh(conn, recipe_ids):
+    """
+    Rebuilds the documents of the given recipes and returns them keyed by
+    recipe_id. Recipes that do not exist are left out.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return {}
+    stmt = _upsert(db.recipes.c.recipe_id.in_(recipe_ids))
+    result = conn.execute(stmt.returning(db.recipe_documents.c.recipe_id, db.recipe_documents.c.document))
+    return {row.recipe_id: row.document for row in result}
+
+
+def rebuild(batch_size=5000):
+    """
+    Rebuilds the documents of every recipe, one transaction per batch of
+    recipe ids. Returns the number of documents written.
+    """
+    with db.engine.connect() as conn:
+        low, high = conn.execute(
+            sqlalchemy.select(sqlalchemy.func.min(db.recipes.c.recipe_id), sqlalchemy.func.max(db.recipes.c.recipe_id))
+        ).one()
+    if low is None:
+        return 0
+
+    written = 0
+    for start in range(low, high + 1, batch_size):
+        with db.engine.begin() as conn:
+            result = conn.execute(_upsert(db.recipes.c.recipe_id.between(start, start + batch_size - 1)))
+            written += result.rowcount
+    return written
+
+
+if __name__ == "__main__":
+    print(f"rebuilt {rebuild()} recipe documents")
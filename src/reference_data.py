@@ -0,0 +1,142 @@
+import os
+import contextlib
+import time
+
+import sqlalchemy
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from src import database as db
+from src.refreshing import RefreshingIndex
+
+
+@contextlib.contextmanager
+def _connection(conn):
+    if conn is not None:
+        yield conn
+    else:
+        with db.engine.connect() as conn:
+            yield conn
+
+
+class ReferenceData(RefreshingIndex):
+    """
+    In memory copy of the lookup tables recipes point at: cuisine types, meal
+    types and ingredient names. Loaded on startup (or first use); endpoints
+    call ensure_fresh(), which reloads it in the background once older than
+    `refresh_seconds`. Ingredients added through the API are registered as
+    they are inserted.
+
+    Ids that are not in memory are looked up in the database before being
+    reported as missing, so rows written by other processes are never
+    rejected.
+
+    Methods that may hit the database take an optional `conn` to run on (for
+    example inside db.run()); without one they check out a connection from
+    the sync engine.
+    """
+
+    description = "reference data"
+
+    def __init__(self, refresh_seconds, clock=time.monotonic):
+        super().__init__(refresh_seconds, clock)
+        self.cuisine_types = {}
+        self.meal_types = {}
+        self.ingredients = {}
+        self._ingredient_ids = {}
+
+    def fetch(self, conn):
+        cuisine_types = dict(conn.execute(
+            sqlalchemy.select(db.cuisine_type.c.cuisine_type_id, db.cuisine_type.c.cuisine_type)
+        ).all())
+        meal_types = dict(conn.execute(
+            sqlalchemy.select(db.meal_type.c.meal_type_id, db.meal_type.c.meal_type)
+        ).all())
+        ingredients = dict(conn.execute(
+            sqlalchemy.select(db.ingredients.c.ingredient_id, db.ingredients.c.ingredient_name)
+        ).all())
+        return cuisine_types, meal_types, ingredients
+
+    def install(self, fetched):
+        cuisine_types, meal_types, ingredients = fetched
+        ingredient_ids = {}
+        for ingredient_id, name in sorted(ingredients.items(), reverse=True):
+            # keep the lowest id when names repeat
+            ingredient_ids[name] = ingredient_id
+
+        # swap whole dicts so readers never see a half loaded registry
+        self.cuisine_types = cuisine_types
+        self.meal_types = meal_types
+        self.ingredients = ingredients
+        self._ingredient_ids = ingredient_ids
+        self._loaded_at = self._clock()
+
+    def load(self, conn=None):
+        with _connection(conn) as conn:
+            super().load(conn)
+
+    def _ensure_loaded_once(self, conn):
+        # only the first load happens inline; a stale copy keeps being used
+        # until ensure_fresh() has rebuilt it in the background
+        if self._loaded_at is None:
+            self.ensure_loaded(conn)
+
+    def missing_cuisine_type_ids(self, ids, conn=None):
+        self._ensure_loaded_once(conn)
+        return self._missing(ids, "cuisine_types", db.cuisine_type, "cuisine_type_id", "cuisine_type", conn)
+
+    def missing_meal_type_ids(self, ids, conn=None):
+        self._ensure_loaded_once(conn)
+        return self._missing(ids, "meal_types", db.meal_type, "meal_type_id", "meal_type", conn)
+
+    def missing_ingredient_ids(self, ids, conn=None):
+        self._ensure_loaded_once(conn)
+        return self._missing(ids, "ingredients", db.ingredients, "ingredient_id", "ingredient_name", conn)
+
+    def cuisine_type_ids_matching(self, text, conn=None):
+        self._ensure_loaded_once(conn)
+        return self._matching(text, self.cuisine_types)
+
+    def meal_type_ids_matching(self, text, conn=None):
+        self._ensure_loaded_once(conn)
+        return self._matching(text, self.meal_types)
+
+    def ingredient_id(self, name, conn=None):
+        self._ensure_loaded_once(conn)
+        return self._ingredient_ids.get(name)
+
+    def add_ingredient(self, ingredient_id, name):
+        # copy and swap, like load() and _missing(): readers may be iterating
+        # the current dicts in another thread
+        self.ingredients = {**self.ingredients, ingredient_id: name}
+        if name not in self._ingredient_ids:
+            self._ingredient_ids = {**self._ingredient_ids, name: ingredient_id}
+
+    def _missing(self, ids, attribute, table, id_column, name_column, conn):
+        """
+        Returns the sorted ids that exist neither in memory nor in the table
+        and adds the ones found there to the dict in `attribute`.
+        """
+        known = getattr(self, attribute)
+        unknown = {i for i in ids if i not in known}
+        if not unknown:
+            return []
+        # one `= ANY(:ids)` lookup however many ids are unknown
+        ids_param = sqlalchemy.literal(sorted(unknown), ARRAY(sqlalchemy.Integer))
+        with _connection(conn) as conn:
+            found = conn.execute(
+                sqlalchemy.select(table.c[id_column], table.c[name_column]).where(table.c[id_column] == sqlalchemy.any_(ids_param))
+            ).all()
+        if found:
+            # copy and swap, like load(): _matching() may be iterating the
+            # current dict in another thread
+            setattr(self, attribute, {**getattr(self, attribute), **dict(found)})
+        return sorted(unknown - {row_id for row_id, _ in found})
+
+    @staticmethod
+    def _matching(text, names):
+        # case insensitive substring match, mirroring ILIKE '%text%'
+        text = text.lower()
+        return sorted(row_id for row_id, name in names.items() if text in name.lower())
+
+
+registry = ReferenceData(refresh_seconds=float(os.environ.get("REFERENCE_DATA_REFRESH_SECONDS", 300)))
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import threading
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from src import database as db
+
+
+class RefreshingIndex:
+    """
+    Base for the in memory indexes rebuilt from the database once older than
+    `refresh_seconds`. Subclasses implement fetch(conn), which reads what
+    they need from the database, and install(fetched), which builds the
+    index from it and swaps it in whole, setting `_loaded_at`.
+
+    ensure_loaded() is for callers already holding a connection, such as
+    db.run(). Endpoints call ensure_fresh() instead: the first load is
+    awaited, and a stale index is rebuilt in a background task while
+    requests keep reading the current one. Either way only fetch() runs in
+    db.run(), which under DB_ASYNC is the event loop's thread; install()
+    gets a worker thread.
+
+    `description` names the index in the log when a background rebuild
+    fails.
+    """
+
+    description = "index"
+
+    def __init__(self, refresh_seconds, clock=time.monotonic):
+        self.refresh_seconds = refresh_seconds
+        self._clock = clock
+        # only ever tried, never waited on: under the async engine the
+        # loader may be a greenlet on this very thread, waiting for the
+        # event loop we'd block
+        self._load_lock = threading.Lock()
+        self._loaded_at = None
+        self._refresh = None
+
+    def needs_load(self):
+        return self._loaded_at is None or self._clock() - self._loaded_at >= self.refresh_seconds
+
+    def fetch(self, conn):
+        raise NotImplementedError
+
+    def install(self, fetched):
+        raise NotImplementedError
+
+    def load(self, conn):
+        self.install(self.fetch(conn))
+
+    def ensure_loaded(self, conn):
+        if not self.needs_load():
+            return
+        if not self._load_lock.acquire(blocking=False):
+            # nothing to serve yet, so load as well; otherwise serve the
+            # current index while another caller rebuilds it
+            if self._loaded_at is None:
+                self.load(conn)
+            return
+        try:
+            self.load(conn)
+        finally:
+            self._load_lock.release()
+
+    async def ensure_fresh(self):
+        """
+        Loads the index if it never was. A stale index is rebuilt in a
+        background task instead, since that can take seconds; lookups use
+        the current one meanwhile.
+        """
+        if self._loaded_at is None:
+            await self._reload()
+        elif self.needs_load() and (self._refresh is None or self._refresh.done()):
+            self._refresh = asyncio.get_running_loop().create_task(self._refresh_quietly())
+
+    async def _reload(self):
+        # ensure_loaded(), with the build moved off the event loop
+        if not self.needs_load():
+            return
+        if not self._load_lock.acquire(blocking=False):
+            if self._loaded_at is None:
+                await self._load()
+            return
+        try:
+            await self._load()
+        finally:
+            self._load_lock.release()
+
+    async def _load(self):
+        fetched = await db.run(self.fetch)
+        await run_in_threadpool(self.install, fetched)
+
+    async def _refresh_quietly(self):
+        try:
+            await self._reload()
+        except Exception:
+            # the current index stays in use until the next attempt
+            logging.getLogger(type(self).__module__).exception("refreshing the %s failed", self.description)
@@ -0,0 +1,270 @@
+import os
+import threading
+import time
+
+import numpy as np
+import sqlalchemy
+
+from src import database as db
+from src.arrays import distinct_sorted, first_of_runs, run_offsets
+from src.refreshing import RefreshingIndex
+
+# users read per fetch while loading, each with its array of favorites
+LOAD_CHUNK_USERS = 1000
+# recipe pairs generated per step of a build, bounding its temporary arrays
+BUILD_CHUNK_PAIRS = 5000000
+
+
+def _neighbors(positions, starts, sizes, counted_sizes, recipe_count, k):
+    """
+    Finds each recipe's `k` most co-favorited recipes. `positions` holds each
+    user's favorites (as recipe positions) contiguously, located by `starts`
+    and `sizes`; `counted_sizes` is 0 for users left out of the counts.
+
+    Recipes are taken a block at a time: every favorite of a recipe in the
+    block is paired with the other favorites of its user, the pairs are
+    counted by sorting, and only the top `k` per recipe is kept. A block
+    holds about BUILD_CHUNK_PAIRS pairs, so the whole recipe x recipe matrix
+    never exists at once. Returns CSR arrays: offsets into neighbor
+    positions and counts, most shared first and then by position.
+    """
+    element_starts = np.repeat(starts, sizes)
+    element_sizes = np.repeat(counted_sizes, sizes)
+    by_recipe = np.argsort(positions, kind="stable")
+    recipe_bounds = np.searchsorted(positions[by_recipe], np.arange(recipe_count + 1))
+    # pairs each recipe spawns, to cut the recipes into blocks
+    pair_totals = np.cumsum(np.bincount(positions, weights=np.maximum(element_sizes - 1, 0), minlength=recipe_count))
+    cuts = np.searchsorted(pair_totals, np.arange(BUILD_CHUNK_PAIRS, pair_totals[-1] if recipe_count else 0, BUILD_CHUNK_PAIRS))
+    block_bounds = np.unique(np.concatenate(([0], cuts + 1, [recipe_count])).clip(0, recipe_count))
+
+    rows, columns, counts = [], [], []
+    for first_recipe, end_recipe in zip(block_bounds[:-1], block_bounds[1:]):
+        elements = by_recipe[recipe_bounds[first_recipe]:recipe_bounds[end_recipe]]
+        elements = elements[element_sizes[elements] > 1]
+        if len(elements) == 0:
+            continue
+        left = np.repeat(elements, element_sizes[elements])
+        right = np.repeat(element_starts[elements], element_sizes[elements]) + run_offsets(element_sizes[elements])
+        keep = left != right
+        keys = np.sort(positions[left[keep]].astype(np.int64) * recipe_count + positions[right[keep]])
+        first = np.flatnonzero(first_of_runs(keys))
+        block_counts = np.diff(np.append(first, len(keys))).astype(np.int32)
+        keys = keys[first]
+        block_rows, block_columns = keys // recipe_count, keys % recipe_count
+
+        order = np.lexsort((block_columns, -block_counts, block_rows))
+        block_rows, block_columns, block_counts = block_rows[order], block_columns[order], block_counts[order]
+        index = np.arange(len(block_rows))
+        rank = index - np.maximum.accumulate(np.where(first_of_runs(block_rows), index, 0))
+        top = rank < k
+        rows.append(block_rows[top])
+        columns.append(block_columns[top].astype(np.int32))
+        counts.append(block_counts[top])
+
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+    columns = np.concatenate(columns) if columns else np.empty(0, dtype=np.int32)
+    counts = np.concatenate(counts) if counts else np.empty(0, dtype=np.int32)
+    offsets = np.searchsorted(rows, np.arange(recipe_count + 1)).astype(np.int64)
+    return offsets, columns, counts
+
+
+class CoFavoriteIndex(RefreshingIndex):
+    """
+    In memory "users who favorited this also favorited" index.
+
+    A build counts, for every pair of recipes, the users that favorited both
+    (a sparse recipe x recipe co-occurrence matrix, generated and summed
+    with numpy a block of recipes at a time) and keeps each recipe's `top_k`
+    most co-favorited recipes as CSR arrays. Users with more than
+    `max_user_favorites` favorites are left out of the counts: they add that
+    many squared pairs and say little about any one of them.
+
+    Favorites and unfavorites apply incrementally between builds: the
+    user's favorites (kept from the build, also as CSR arrays) give the
+    pairs that change, and their +1/-1 go to a delta overlay added to the
+    stored neighbors on lookup. A pair outside a recipe's stored top k only
+    counts its deltas until the next build, which is exact again; the index
+    is rebuilt once older than `refresh_seconds`.
+
+    Changes that arrive while a build is reading the database are kept and
+    replayed onto the new index. Replaying is idempotent against the user's
+    favorites, so one the build already saw is not counted twice.
+    """
+
+    description = "similar favorites index"
+
+    def __init__(self, refresh_seconds, top_k, max_user_favorites, clock=time.monotonic):
+        super().__init__(refresh_seconds, clock)
+        self.top_k = top_k
+        self.max_user_favorites = max_user_favorites
+        # guards the overlays and is held just for in memory work
+        self._lock = threading.Lock()
+        self.build_seconds = None
+        self._base = self._build(np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32))
+        # user_id -> current favorites, for users changed since the build
+        self._user_overlay = {}
+        # recipe_id -> {recipe_id: change in shared favorites}
+        self._deltas = {}
+        # (version, user_id, recipe_id, favorited) since a build started
+        self._changes = []
+        self._version = 0
+
+    def fetch(self, conn):
+        with self._lock:
+            version = self._version
+        favorites = db.favorited_recipes
+        result = conn.execution_options(yield_per=LOAD_CHUNK_USERS).execute(
+            sqlalchemy.select(favorites.c.user_id, sqlalchemy.func.array_agg(favorites.c.recipe_id))
+            .group_by(favorites.c.user_id)
+        )
+        user_ids, recipe_arrays = [], []
+        for user_id, recipe_ids in result:
+            user_ids.append(user_id)
+            recipe_arrays.append(np.array(recipe_ids, dtype=np.int32))
+        return version, user_ids, recipe_arrays
+
+    def install(self, fetched):
+        version, user_ids, recipe_arrays = fetched
+        recipe_column = np.concatenate(recipe_arrays) if recipe_arrays else np.empty(0, dtype=np.int32)
+        user_column = np.repeat(np.array(user_ids, dtype=np.int32), [len(recipe_ids) for recipe_ids in recipe_arrays])
+        self.build_arrays(user_column, recipe_column, since=version)
+
+    def _build(self, user_column, recipe_column):
+        # one int64 key per favorite orders them by user and then recipe
+        keys = distinct_sorted(np.sort((user_column.astype(np.int64) << 32) | recipe_column.astype(np.int64)))
+        users = (keys >> 32).astype(np.int32)
+        recipes = (keys & 0xFFFFFFFF).astype(np.int32)
+        recipe_ids = distinct_sorted(np.sort(recipes))
+        positions = np.searchsorted(recipe_ids, recipes).astype(np.int32)
+        starts = np.flatnonzero(first_of_runs(users))
+        user_offsets = np.append(starts, len(keys)).astype(np.int64)
+        sizes = np.diff(user_offsets)
+        counted_sizes = np.where(sizes > self.max_user_favorites, 0, sizes)
+
+        offsets, neighbors, counts = _neighbors(positions, starts, sizes, counted_sizes, len(recipe_ids), self.top_k)
+        return recipe_ids, offsets, recipe_ids[neighbors], counts, users[starts], user_offsets, recipes
+
+    def build(self, rows):
+        """
+        Replaces the index with the given (user_id, recipe_id) rows.
+        """
+        pairs = np.array(list(rows), dtype=np.int32).reshape(-1, 2)
+        self.build_arrays(pairs[:, 0], pairs[:, 1])
+
+    def build_arrays(self, user_column, recipe_column, since=None):
+        """
+        Replaces the index with the favorites in two parallel id arrays.
+        Changes newer than version `since` are replayed on top; by default
+        none are.
+        """
+        started = time.perf_counter()
+        base = self._build(user_column, recipe_column)
+        build_seconds = time.perf_counter() - started
+        with self._lock:
+            self._base = base
+            self._user_overlay = {}
+            self._deltas = {}
+            self._changes = [] if since is None else [change for change in self._changes if change[0] > since]
+            for _, user_id, recipe_id, favorited in self._changes:
+                self._apply(user_id, recipe_id, favorited)
+            self.build_seconds = build_seconds
+            self._loaded_at = self._clock()
+
+    def _favorites(self, user_id):
+        favorites = self._user_overlay.get(user_id)
+        if favorites is None:
+            user_ids, user_offsets, recipes = self._base[4:]
+            i = np.searchsorted(user_ids, user_id)
+            if i < len(user_ids) and user_ids[i] == user_id:
+                favorites = set(recipes[user_offsets[i]:user_offsets[i + 1]].tolist())
+            else:
+                favorites = set()
+        return favorites
+
+    def _apply(self, user_id, recipe_id, favorited):
+        favorites = self._favorites(user_id)
+        if (recipe_id in favorites) == favorited:
+            return
+        if favorited:
+            partners, changed = favorites, favorites | {recipe_id}
+        else:
+            changed = favorites - {recipe_id}
+            partners = changed
+        self._user_overlay[user_id] = changed
+        # a user over the limit is left out of the counts, as in builds, so
+        # crossing it takes all of the user's pairs out or puts them back
+        was_counted = len(favorites) <= self.max_user_favorites
+        is_counted = len(changed) <= self.max_user_favorites
+        if was_counted and not is_counted:
+            self._count_pairs(favorites, -1)
+        elif is_counted and not was_counted:
+            self._count_pairs(changed, 1)
+        elif is_counted:
+            delta = 1 if favorited else -1
+            row = self._deltas.setdefault(recipe_id, {})
+            for other in partners:
+                row[other] = row.get(other, 0) + delta
+                other_row = self._deltas.setdefault(other, {})
+                other_row[recipe_id] = other_row.get(recipe_id, 0) + delta
+
+    def _count_pairs(self, recipe_ids, delta):
+        # every pair among one user's favorites, in both directions
+        for recipe_id in recipe_ids:
+            row = self._deltas.setdefault(recipe_id, {})
+            for other in recipe_ids:
+                if other != recipe_id:
+                    row[other] = row.get(other, 0) + delta
+
+    def record(self, user_id, recipe_ids, favorited):
+        """
+        Applies committed favorites (or unfavorites) of the user.
+        """
+        with self._lock:
+            # nothing to update, or replay, until a load has started
+            if self._loaded_at is None and not self._load_lock.locked():
+                return
+            for recipe_id in recipe_ids:
+                self._version += 1
+                self._changes.append((self._version, user_id, recipe_id, favorited))
+                self._apply(user_id, recipe_id, favorited)
+            if not self._load_lock.locked():
+                # no build is reading, so no change needs replaying
+                self._changes.clear()
+
+    def similar(self, recipe_id, limit=10):
+        """
+        Returns up to `limit` (recipe_id, shared_favorites) pairs for the
+        recipes most often favorited by the users who favorited `recipe_id`,
+        most shared first and then by id.
+        """
+        with self._lock:
+            recipe_ids, offsets, neighbors, counts = self._base[:4]
+            i = np.searchsorted(recipe_ids, recipe_id)
+            shared = {}
+            if i < len(recipe_ids) and recipe_ids[i] == recipe_id:
+                shared = dict(zip(neighbors[offsets[i]:offsets[i + 1]].tolist(), counts[offsets[i]:offsets[i + 1]].tolist()))
+            for other, delta in self._deltas.get(recipe_id, {}).items():
+                shared[other] = shared.get(other, 0) + delta
+        ranked = sorted((item for item in shared.items() if item[1] > 0), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "recipes": len(self._base[0]),
+                "users": len(self._base[4]),
+                "neighbors": len(self._base[2]),
+                "bytes": sum(array.nbytes for array in self._base),
+                "build_seconds": self.build_seconds,
+                "changed_users": len(self._user_overlay),
+                "delta_pairs": sum(len(row) for row in self._deltas.values()),
+                "loaded_seconds_ago": None if self._loaded_at is None else self._clock() - self._loaded_at,
+                "refresh_seconds": self.refresh_seconds,
+            }
+
+
+similar_by_favorites = CoFavoriteIndex(
+    refresh_seconds=float(os.environ.get("SIMILAR_FAVORITES_REFRESH_SECONDS", 3600)),
+    top_k=int(os.environ.get("SIMILAR_FAVORITES_TOP_K", 50)),
+    max_user_favorites=int(os.environ.get("SIMILAR_FAVORITES_MAX_USER_FAVORITES", 1000)),
+)
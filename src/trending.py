@@ -0,0 +1,90 @@
+import datetime
+import math
+import os
+import time
+
+import sqlalchemy
+
+from src import database as db
+from src.refreshing import RefreshingIndex
+
+
+class TrendingRecipes(RefreshingIndex):
+    """
+    Precomputed ranking for GET /recipes/trending.
+
+    Every favorite made in the last `window_hours` adds to its recipe's
+    score, weighted by exp(-ln 2 * age / half_life): a favorite made
+    `half_life_hours` ago counts half as much as one made now. One grouped
+    query over the (date_favorited, recipe_id) index computes the top
+    `keep` scores, with the recipe names, once older than `refresh_seconds`;
+    the endpoint only slices that list.
+
+    Like the in memory indexes, a stale ranking is recomputed in a
+    background task while requests keep reading the current one, which is
+    swapped in whole.
+    """
+
+    description = "trending recipes ranking"
+
+    def __init__(self, window_hours, half_life_hours, keep, refresh_seconds, clock=time.monotonic):
+        super().__init__(refresh_seconds, clock)
+        self.window_hours = window_hours
+        self.half_life_hours = half_life_hours
+        self.keep = keep
+        self._ranking = []
+
+    def _statement(self):
+        favorites = db.favorited_recipes
+        age_seconds = sqlalchemy.func.extract("epoch", sqlalchemy.func.now() - favorites.c.date_favorited)
+        # Postgres raises on exp() underflow instead of returning 0
+        exponent = sqlalchemy.func.greatest(-math.log(2) / (self.half_life_hours * 3600) * age_seconds, -700)
+        window = sqlalchemy.literal(datetime.timedelta(hours=self.window_hours), sqlalchemy.Interval)
+        scores = (
+            sqlalchemy.select(
+                favorites.c.recipe_id,
+                sqlalchemy.func.sum(sqlalchemy.func.exp(exponent)).label("score"),
+                sqlalchemy.func.count().label("recent_favorites"),
+            )
+            .where(favorites.c.date_favorited >= sqlalchemy.func.now() - window)
+            .group_by(favorites.c.recipe_id)
+            .order_by(sqlalchemy.desc("score"), favorites.c.recipe_id)
+            .limit(self.keep)
+            .subquery("scores")
+        )
+        return (
+            sqlalchemy.select(scores, db.recipes.c.recipe_name)
+            .join(db.recipes, db.recipes.c.recipe_id == scores.c.recipe_id)
+            .order_by(scores.c.score.desc(), scores.c.recipe_id)
+        )
+
+    def fetch(self, conn):
+        return conn.execute(self._statement()).all()
+
+    def install(self, rows):
+        self._ranking = [
+            {"recipe_id": row.recipe_id, "recipe_name": row.recipe_name,
+             "score": float(row.score), "recent_favorites": row.recent_favorites}
+            for row in rows
+        ]
+        self._loaded_at = self._clock()
+
+    def top(self, limit):
+        return self._ranking[:limit]
+
+    def stats(self):
+        return {
+            "recipes": len(self._ranking),
+            "window_hours": self.window_hours,
+            "half_life_hours": self.half_life_hours,
+            "loaded_seconds_ago": None if self._loaded_at is None else self._clock() - self._loaded_at,
+            "refresh_seconds": self.refresh_seconds,
+        }
+
+
+trending_recipes = TrendingRecipes(
+    window_hours=float(os.environ.get("TRENDING_WINDOW_HOURS", 7 * 24)),
+    half_life_hours=float(os.environ.get("TRENDING_HALF_LIFE_HOURS", 24)),
+    keep=int(os.environ.get("TRENDING_KEEP", 1000)),
+    refresh_seconds=float(os.environ.get("TRENDING_REFRESH_SECONDS", 60)),
+)
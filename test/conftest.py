@@ -0,0 +1,62 @@
+import pytest
+
+from src.autocomplete import PrefixIndex
+from src.cookable import IngredientRecipeIndex
+from src.similar_favorites import CoFavoriteIndex
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def prefix_index():
+    index = PrefixIndex(refresh_seconds=60)
+    index.build([
+        (1, "Salt", 50),
+        (2, "salmon", 7),
+        (3, "sage", 7),
+        (4, "Sugar", 30),
+        (5, "salt", 5),
+        (6, "pepper", 40),
+    ])
+    return index
+
+
+@pytest.fixture
+def cookable_index():
+    index = IngredientRecipeIndex(refresh_seconds=60)
+    index.build([
+        # recipe 1: chicken, rice
+        (1, 10), (1, 11),
+        # recipe 2: chicken, rice, garlic, the chicken listed twice
+        (2, 10), (2, 11), (2, 12), (2, 10),
+        # recipe 3: rice
+        (3, 11),
+        # recipe 4: beef, garlic, onion
+        (4, 13), (4, 12), (4, 14),
+    ])
+    return index
+
+
+@pytest.fixture
+def make_similar_index():
+    def make(top_k=10, max_user_favorites=100):
+        index = CoFavoriteIndex(refresh_seconds=60, top_k=top_k, max_user_favorites=max_user_favorites)
+        index.build([
+            (1, 10), (1, 11), (1, 12),
+            (2, 10), (2, 11),
+            (3, 10), (3, 12), (3, 13),
+            (4, 13),
+        ])
+        return index
+    return make
@@ -0,0 +1,27 @@
+def test_autocomplete_prefix(prefix_index):
+    assert [name for _, name, _ in prefix_index.search("sa")] == ["Salt", "sage", "salmon"]
+    assert [name for _, name, _ in prefix_index.search("SAL")] == ["Salt", "salmon"]
+    assert prefix_index.search("x") == []
+
+def test_autocomplete_top_k(prefix_index):
+    # duplicate names keep the lowest id and add up their usage
+    assert prefix_index.search("s", limit=2) == [(1, "Salt", 55), (4, "Sugar", 30)]
+    # ties are broken by name
+    assert prefix_index.search("s", limit=3)[2] == (3, "sage", 7)
+
+def test_autocomplete_add(prefix_index):
+    prefix_index.add(7, "Saffron")
+    prefix_index.add(8, "sage")
+    assert prefix_index.search("saf") == [(7, "Saffron", 0)]
+    assert prefix_index.search("sag") == [(3, "sage", 7)]
+    assert prefix_index.stats()["entries"] == 6
+
+def test_autocomplete_add_during_build(prefix_index):
+    # a rebuild has read the ingredients, then one is added before it swaps in
+    version = prefix_index._version
+    prefix_index.add(7, "Saffron")
+    prefix_index.build([(1, "Salt", 50), (2, "salmon", 7)], since=version)
+    assert prefix_index.search("sa") == [(1, "Salt", 50), (2, "salmon", 7), (7, "Saffron", 0)]
+    # once a rebuild has read it, it comes with its usage
+    prefix_index.build([(1, "Salt", 50), (7, "Saffron", 3)], since=prefix_index._version)
+    assert prefix_index.search("saf") == [(7, "Saffron", 3)]
@@ -0,0 +1,54 @@
+from src.cache import LRUCache
+
+
+def test_cache_hit_and_miss():
+    cache = LRUCache(max_bytes=1000, ttl_seconds=60)
+    assert cache.get(1) is None
+    cache.set(1, {"recipe_id": 1})
+    assert cache.get(1) == {"recipe_id": 1}
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+def test_cache_ttl(clock):
+    cache = LRUCache(max_bytes=1000, ttl_seconds=10, clock=clock)
+    cache.set(1, "pasta")
+    clock.now = 9.9
+    assert cache.get(1) == "pasta"
+    clock.now = 10
+    assert cache.get(1) is None
+    assert cache.stats()["expirations"] == 1
+
+def test_cache_lru_eviction():
+    # each value encodes to 7 bytes ("xxxxx" with quotes)
+    cache = LRUCache(max_bytes=21, ttl_seconds=60)
+    cache.set(1, "aaaaa")
+    cache.set(2, "bbbbb")
+    cache.set(3, "ccccc")
+    cache.get(1)
+    cache.set(4, "ddddd")
+    assert cache.get(2) is None
+    assert cache.get(1) == "aaaaa"
+    assert cache.get(4) == "ddddd"
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] <= 21
+
+def test_cache_invalidate():
+    cache = LRUCache(max_bytes=1000, ttl_seconds=60)
+    cache.set(1, "pasta")
+    cache.invalidate(1)
+    assert cache.get(1) is None
+    assert cache.stats()["invalidations"] == 1
+
+def test_cache_stale_set():
+    cache = LRUCache(max_bytes=1000, ttl_seconds=60)
+    # a reader misses and fetches while a writer commits and invalidates
+    generation = cache.generation(1)
+    cache.invalidate(1)
+    cache.set(1, "old pasta", generation)
+    assert cache.get(1) is None
+    assert cache.stats()["stale_sets"] == 1
+    # a fetch that started after the write is cached
+    cache.set(1, "new pasta", cache.generation(1))
+    assert cache.get(1) == "new pasta"
@@ -0,0 +1,27 @@
+from src.cookable import IngredientRecipeIndex
+
+
+def test_cookable_exact(cookable_index):
+    assert cookable_index.search([10, 11]) == [(1, 2, 2), (3, 1, 1)]
+    assert cookable_index.search([99]) == []
+    assert cookable_index.search([]) == []
+
+def test_cookable_missing(cookable_index):
+    # full coverage first, then by fewest missing, then most matched
+    assert cookable_index.search([10, 11], max_missing=1) == [(1, 2, 2), (3, 1, 1), (2, 2, 3)]
+    assert cookable_index.search([10, 11, 12], max_missing=2) == [(2, 3, 3), (1, 2, 2), (3, 1, 1), (4, 1, 3)]
+    assert cookable_index.search([10, 11, 12], max_missing=2, limit=2) == [(2, 3, 3), (1, 2, 2)]
+
+def test_cookable_set_recipe(cookable_index):
+    # recipe 3 changes rice to beef; recipe 5 is new
+    cookable_index.set_recipe(3, [13])
+    cookable_index.set_recipe(5, [10, 13])
+    assert cookable_index.search([10, 11]) == [(1, 2, 2)]
+    assert cookable_index.search([13]) == [(3, 1, 1)]
+    assert cookable_index.search([10, 13]) == [(5, 2, 2), (3, 1, 1)]
+    assert cookable_index.stats()["overlay_recipes"] == 2
+
+def test_cookable_empty():
+    index = IngredientRecipeIndex(refresh_seconds=60)
+    index.build([])
+    assert index.search([1]) == []
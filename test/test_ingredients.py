@@ -31,3 +31,27 @@ def test_add_ingredient2():
     }
     response = client.post("/ingredients/", json=test)
     assert response.status_code == 422
+
+def test_get_ingredient_pages():
+    response = client.get("/ingredients/0?limit=1")
+    assert response.status_code == 200
+    first_page = response.json()
+    assert len(first_page["recipes"]) == 1
+    assert first_page["total_recipes"] >= 1
+
+    if first_page["next_cursor"] is not None:
+        response = client.get("/ingredients/0?limit=1&cursor=" + first_page["next_cursor"])
+        assert response.status_code == 200
+        assert response.json()["recipes"][0]["recipe_id"] > first_page["recipes"][0]["recipe_id"]
+
+def test_get_ingredient_pages2():
+    response = client.get("/ingredients/0?cursor=not-a-cursor")
+    assert response.status_code == 400
+
+def test_get_ingredient_stream():
+    response = client.get("/ingredients/0?stream=true")
+    assert response.status_code == 200
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0]["ingredient_id"] == 0
+    assert len(lines) == lines[0]["total_recipes"] + 1
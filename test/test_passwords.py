@@ -0,0 +1,49 @@
+import asyncio
+import base64
+import hashlib
+
+import pytest
+
+from src.passwords import PasswordHasher, HasherBusy, default_workers, parse
+
+
+def legacy_hash(password, salt=b"s" * 32):
+    key = hashlib.pbkdf2_hmac('sha256', password.encode('utf-16'), salt, 100000)
+    return base64.b64encode(salt + key).decode('utf-8')
+
+
+def test_hash_and_verify():
+    hasher = PasswordHasher(iterations=1000, workers=0, max_pending=4)
+    stored = asyncio.run(hasher.hash("hunter2"))
+    assert stored.startswith("pbkdf2_sha256$1000$")
+    assert asyncio.run(hasher.verify("hunter2", stored))
+    assert not asyncio.run(hasher.verify("hunter3", stored))
+    assert not hasher.needs_rehash(stored)
+
+def test_verify_legacy_hash():
+    hasher = PasswordHasher(iterations=200000, workers=0, max_pending=4)
+    stored = legacy_hash("hunter2")
+    assert parse(stored)[0] == 100000
+    assert asyncio.run(hasher.verify("hunter2", stored))
+    assert hasher.needs_rehash(stored)
+
+def test_process_pool():
+    hasher = PasswordHasher(iterations=1000, workers=1, max_pending=4)
+    try:
+        stored = asyncio.run(hasher.hash("hunter2"))
+        assert asyncio.run(hasher.verify("hunter2", stored))
+    finally:
+        hasher.shutdown()
+
+def test_busy():
+    hasher = PasswordHasher(iterations=1000, workers=0, max_pending=0)
+    with pytest.raises(HasherBusy):
+        asyncio.run(hasher.hash("hunter2"))
+    assert hasher.stats()["rejected"] == 1
+
+def test_default_workers():
+    assert default_workers({"PASSWORD_HASH_WORKERS": "3", "VERCEL": "1"}) == 3
+    assert default_workers({"DB_POOL_PROFILE": "serverless"}) == 0
+    assert default_workers({"VERCEL": "1"}) == 0
+    assert default_workers({"AWS_LAMBDA_FUNCTION_NAME": "recipes"}) == 0
+    assert default_workers({"DB_POOL_PROFILE": "burst"}) >= 1
@@ -0,0 +1,56 @@
+import asyncio
+
+from src import refreshing
+from src.reference_data import ReferenceData
+
+
+def make_reference_data(clock):
+    data = ReferenceData(refresh_seconds=60, clock=clock)
+    data.fetches = 0
+
+    def fetch(conn):
+        data.fetches += 1
+        return {1: "Italian", 2: "Mexican"}, {1: "Dinner"}, {5: "salt", 3: "salt", 4: "sugar"}
+
+    data.fetch = fetch
+    return data
+
+
+async def run_without_database(fn, *args):
+    return fn(None, *args)
+
+
+def test_reference_data_lookups(clock):
+    data = make_reference_data(clock)
+    data.load(object())
+    assert data.cuisine_type_ids_matching("ICAN", object()) == [2]
+    assert data.meal_type_ids_matching("din", object()) == [1]
+    assert data.ingredient_id("salt", object()) == 3
+
+def test_add_ingredient(clock):
+    data = make_reference_data(clock)
+    data.load(object())
+    ingredients = data.ingredients
+    data.add_ingredient(7, "pepper")
+    data.add_ingredient(8, "salt")
+    assert data.ingredient_id("pepper", object()) == 7
+    assert data.ingredient_id("salt", object()) == 3
+    assert data.ingredients[8] == "salt"
+    # swapped for a new dict, never changed under a reader
+    assert 7 not in ingredients
+
+def test_reference_data_refresh_in_background(clock, monkeypatch):
+    monkeypatch.setattr(refreshing.db, "run", run_without_database)
+    data = make_reference_data(clock)
+
+    async def scenario():
+        await data.ensure_fresh()
+        clock.now = 60
+        # a stale copy is still served by lookups, never reloaded inline
+        assert data.ingredient_id("sugar", object()) == 4
+        assert data.fetches == 1
+        await data.ensure_fresh()
+        await data._refresh
+        assert data.fetches == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,92 @@
+import asyncio
+import threading
+
+from src import refreshing
+from src.refreshing import RefreshingIndex
+
+
+class CountingIndex(RefreshingIndex):
+    description = "counting index"
+
+    def __init__(self, clock):
+        super().__init__(refresh_seconds=60, clock=clock)
+        self.loads = 0
+        self.fail = False
+        self.install_threads = []
+
+    def fetch(self, conn):
+        if self.fail:
+            raise RuntimeError("database is down")
+        return self.loads + 1
+
+    def install(self, fetched):
+        self.install_threads.append(threading.current_thread())
+        self.loads = fetched
+        self._loaded_at = self._clock()
+
+
+async def run_without_database(fn, *args):
+    return fn(None, *args)
+
+
+def test_refresh_ttl(clock):
+    index = CountingIndex(clock)
+    assert index.needs_load()
+    index.ensure_loaded(None)
+    clock.now = 59
+    assert not index.needs_load()
+    index.ensure_loaded(None)
+    assert index.loads == 1
+    clock.now = 60
+    assert index.needs_load()
+    index.ensure_loaded(None)
+    assert index.loads == 2
+
+def test_refresh_never_waits(clock):
+    index = CountingIndex(clock)
+    # another caller is loading: with nothing to serve, load anyway
+    index._load_lock.acquire()
+    index.ensure_loaded(None)
+    assert index.loads == 1
+    # once loaded, serve the stale index instead
+    clock.now = 60
+    index.ensure_loaded(None)
+    assert index.loads == 1
+    index._load_lock.release()
+
+def test_refresh_in_background(clock, monkeypatch):
+    monkeypatch.setattr(refreshing.db, "run", run_without_database)
+    index = CountingIndex(clock)
+
+    async def scenario():
+        await index.ensure_fresh()
+        assert index.loads == 1
+        clock.now = 60
+        await index.ensure_fresh()
+        # the stale index is still served while the task rebuilds it
+        assert index.loads == 1
+        refresh = index._refresh
+        await index.ensure_fresh()
+        assert index._refresh is refresh
+        await refresh
+        assert index.loads == 2
+
+    asyncio.run(scenario())
+    # builds run in a worker thread, never on the event loop
+    assert threading.main_thread() not in index.install_threads
+
+def test_refresh_failure_keeps_index(clock, monkeypatch, caplog):
+    monkeypatch.setattr(refreshing.db, "run", run_without_database)
+    index = CountingIndex(clock)
+
+    async def scenario():
+        await index.ensure_fresh()
+        index.fail = True
+        clock.now = 60
+        await index.ensure_fresh()
+        await index._refresh
+
+    asyncio.run(scenario())
+    assert index.loads == 1
+    assert index.needs_load()
+    assert "refreshing the counting index failed" in caplog.text
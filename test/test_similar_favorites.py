@@ -0,0 +1,88 @@
+import numpy as np
+
+from src.similar_favorites import CoFavoriteIndex
+
+
+def test_similar_counts(make_similar_index):
+    index = make_similar_index()
+    assert index.similar(10) == [(11, 2), (12, 2), (13, 1)]
+    assert index.similar(13) == [(10, 1), (12, 1)]
+    assert index.similar(10, limit=1) == [(11, 2)]
+    assert index.similar(99) == []
+
+def test_similar_top_k(make_similar_index):
+    index = make_similar_index(top_k=1)
+    assert index.similar(10) == [(11, 2)]
+    assert index.stats()["neighbors"] == 4
+
+def test_similar_record(make_similar_index):
+    index = make_similar_index()
+    # user 4 favorites 10 and 11, user 1 unfavorites 12
+    index.record(4, [10, 11], True)
+    index.record(1, [12], False)
+    # repeats change nothing
+    index.record(4, [10], True)
+    index.record(1, [12], False)
+    assert index.similar(10) == [(11, 3), (13, 2), (12, 1)]
+    assert index.similar(13) == [(10, 2), (11, 1), (12, 1)]
+
+    rebuilt = CoFavoriteIndex(refresh_seconds=60, top_k=10, max_user_favorites=100)
+    rebuilt.build([
+        (1, 10), (1, 11),
+        (2, 10), (2, 11),
+        (3, 10), (3, 12), (3, 13),
+        (4, 13), (4, 10), (4, 11),
+    ])
+    assert rebuilt.similar(10) == index.similar(10)
+    assert rebuilt.similar(13) == index.similar(13)
+
+def test_similar_heavy_users(make_similar_index):
+    index = make_similar_index(max_user_favorites=2)
+    # only user 2 has at most two favorites
+    assert index.similar(10) == [(11, 1)]
+    assert index.similar(12) == []
+
+def test_similar_record_crossing_limit(make_similar_index):
+    index = make_similar_index(max_user_favorites=2)
+    # user 2 goes over the limit and user 1 back under it
+    index.record(2, [13], True)
+    index.record(1, [10], False)
+
+    rebuilt = CoFavoriteIndex(refresh_seconds=60, top_k=10, max_user_favorites=2)
+    rebuilt.build([
+        (1, 11), (1, 12),
+        (2, 10), (2, 11), (2, 13),
+        (3, 10), (3, 12), (3, 13),
+        (4, 13),
+    ])
+    for recipe_id in (10, 11, 12, 13):
+        assert index.similar(recipe_id) == rebuilt.similar(recipe_id)
+    assert index.similar(10) == []
+    assert index.similar(11) == [(12, 1)]
+
+def test_similar_record_over_limit(make_similar_index):
+    index = make_similar_index(max_user_favorites=2)
+    # user 4 reaches the limit and crosses it, then comes back under
+    index.record(4, [10], True)
+    assert index.similar(13) == [(10, 1)]
+    index.record(4, [11], True)
+    assert index.similar(13) == []
+    assert index.similar(10) == [(11, 1)]
+    index.record(4, [13], False)
+    assert index.similar(10) == [(11, 2)]
+    assert index.similar(13) == []
+
+def test_similar_record_during_build(make_similar_index):
+    index = make_similar_index()
+    # a rebuild has read the favorites and is building in a worker thread
+    index._load_lock.acquire()
+    version = index._version
+    index.record(4, [10], True)
+    index.build_arrays(
+        np.array([1, 1, 1, 2, 2, 3, 3, 3, 4], dtype=np.int32),
+        np.array([10, 11, 12, 10, 11, 10, 12, 13, 13], dtype=np.int32),
+        since=version,
+    )
+    index._load_lock.release()
+    # the favorite made meanwhile is replayed onto the new index
+    assert index.similar(13) == [(10, 2), (12, 1)]